@@ -0,0 +1,222 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from params_cache import new_revision
+
+RESOLUTION_STEP = 64
+MIN_RESOLUTION = 256
+STEPS_STEP = 10
+
+
+class AdaptiveController:
+    """Control de lazo cerrado de calidad/steps/resolución de una sesión.
+
+    Con cada frame entregado recibe el intervalo entre frames y la latencia
+    (`took`) y calcula cuánto se pasa del objetivo (FPS y/o latencia). Si la
+    sesión queda fuera de presupuesto durante `degrade_after` frames baja un
+    escalón; si sobra margen durante `upgrade_after` frames sube uno. Los
+    escalones son, en orden: calidad JPEG, steps y bucket de resolución
+    (de a 64 px, nunca menos de 256). Nunca supera lo que pidió el cliente.
+
+    La histéresis (`hysteresis`, margen relativo sin cambios alrededor del
+    objetivo) y el `cooldown` tras cada cambio evitan oscilar; cambiar la
+    resolución reinicia StreamDiffusion, así que ese escalón espera el doble.
+
+    Con `scale_steps=False` el escalón de steps se saltea: en StreamDiffusion
+    el UNet corre siempre len(t_index_list) pasadas y bajar los steps solo
+    mueve los t_index, sin ahorrar tiempo.
+    """
+
+    def __init__(
+        self,
+        target_fps: float = 0.0,
+        target_latency_ms: float = 0.0,
+        quality: int = 75,
+        min_quality: int = 40,
+        quality_step: int = 10,
+        min_steps: int = 10,
+        hysteresis: float = 0.15,
+        degrade_after: int = 10,
+        upgrade_after: int = 60,
+        cooldown: int = 20,
+        smoothing: float = 0.2,
+        scale_steps: bool = True,
+    ):
+        self.target_fps = target_fps
+        self.target_latency_ms = target_latency_ms
+        self.max_quality = quality
+        self.min_quality = min(min_quality, quality)
+        self.quality_step = max(1, quality_step)
+        self.min_steps = min_steps
+        self.hysteresis = hysteresis
+        self.degrade_after = degrade_after
+        self.upgrade_after = upgrade_after
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.scale_steps = scale_steps
+
+        self.quality = quality
+        self.steps_level = 0
+        self.resolution_level = 0
+        self.fps: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        self.frames = 0
+        self.changes = 0
+        self.last_reason: Optional[str] = None
+        self._last_frame: Optional[float] = None
+        self._over = 0
+        self._under = 0
+        self._hold = 0
+        # Límites de los escalones según los últimos params pedidos por el cliente
+        self._max_steps_level = 0
+        self._max_resolution_level = 0
+        # Último (width, height, steps) pedido por el cliente y la revisión del ajuste
+        self._requested: Optional[Tuple[int, int, int]] = None
+        self._revision: Optional[Tuple[Tuple, int]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_fps > 0 or self.target_latency_ms > 0
+
+    def pressure(self) -> Optional[float]:
+        """Relación medido/objetivo del peor indicador: > 1 es fuera de presupuesto"""
+        ratios = []
+        if self.target_fps > 0 and self.fps:
+            ratios.append(self.target_fps / self.fps)
+        if self.target_latency_ms > 0 and self.latency_ms is not None:
+            ratios.append(self.latency_ms / self.target_latency_ms)
+        return max(ratios) if ratios else None
+
+    def observe(self, took: float, now: Optional[float] = None) -> bool:
+        """Registra un frame entregado (`took` en segundos). Devuelve True si
+        cambió alguna decisión y hay que avisarle al cliente"""
+        now = time.perf_counter() if now is None else now
+        if self._last_frame is not None and now > self._last_frame:
+            self.fps = self._ewma(self.fps, 1.0 / (now - self._last_frame))
+        self._last_frame = now
+        self.latency_ms = self._ewma(self.latency_ms, took * 1000)
+        self.frames += 1
+        if not self.enabled:
+            return False
+        if self._hold > 0:
+            self._hold -= 1
+            return False
+
+        pressure = self.pressure()
+        if pressure is None:
+            return False
+        if pressure > 1 + self.hysteresis:
+            self._over += 1
+            self._under = 0
+        elif pressure < 1 - self.hysteresis:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        if self._over >= self.degrade_after:
+            return self._step(degrade=True)
+        if self._under >= self.upgrade_after:
+            return self._step(degrade=False)
+        return False
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
+
+    def _step(self, degrade: bool) -> bool:
+        self._over = self._under = 0
+        if degrade:
+            if self.quality > self.min_quality:
+                self.quality = max(self.min_quality, self.quality - self.quality_step)
+                reason = "quality_down"
+            elif self.steps_level < self._max_steps_level:
+                self.steps_level += 1
+                reason = "steps_down"
+            elif self.resolution_level < self._max_resolution_level:
+                self.resolution_level += 1
+                reason = "resolution_down"
+            else:
+                return False
+        else:
+            # Se recupera en orden inverso: primero resolución, al final calidad
+            if self.resolution_level > 0:
+                self.resolution_level -= 1
+                reason = "resolution_up"
+            elif self.steps_level > 0:
+                self.steps_level -= 1
+                reason = "steps_up"
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + self.quality_step)
+                reason = "quality_up"
+            else:
+                return False
+        self._hold = self.cooldown * (2 if reason.startswith("resolution") else 1)
+        self.changes += 1
+        self.last_reason = reason
+        return True
+
+    def apply(self, params):
+        """Devuelve `params` con los steps y la resolución que decidió el controlador.
+        Los params ajustados llevan su propia revisión (y se reutilizan mientras
+        no cambie nada) para que el pipeline detecte el cambio"""
+        self._requested = (params.width, params.height, params.steps)
+        self._max_steps_level = (
+            max(0, (params.steps - self.min_steps) // STEPS_STEP) if self.scale_steps else 0
+        )
+        self._max_resolution_level = max(
+            0, (max(params.width, params.height) - MIN_RESOLUTION) // RESOLUTION_STEP
+        )
+        self.steps_level = min(self.steps_level, self._max_steps_level)
+        self.resolution_level = min(self.resolution_level, self._max_resolution_level)
+        if not self.enabled or (self.steps_level == 0 and self.resolution_level == 0):
+            return params
+
+        width, height, steps = self._effective()
+        key = (getattr(params, "revision", None), width, height, steps)
+        if self._revision is None or self._revision[0] != key:
+            self._revision = (key, new_revision())
+        return params._replace(
+            width=width, height=height, steps=steps, revision=self._revision[1]
+        )
+
+    def _effective(self) -> Tuple[int, int, int]:
+        width, height, steps = self._requested
+        shrink = self.resolution_level * RESOLUTION_STEP
+        return (
+            max(MIN_RESOLUTION, width - shrink),
+            max(MIN_RESOLUTION, height - shrink),
+            max(self.min_steps, steps - self.steps_level * STEPS_STEP),
+        )
+
+    def decision(self) -> Dict[str, Any]:
+        """Mensaje para el cliente con el estado actual del controlador"""
+        width, height, steps = self._effective() if self._requested else (None,) * 3
+        return {
+            "status": "adaptive",
+            "reason": self.last_reason,
+            "quality": self.quality,
+            # None: se respeta lo que pidió el cliente
+            "steps": steps if self.steps_level else None,
+            "width": width if self.resolution_level else None,
+            "height": height if self.resolution_level else None,
+            "fps": round(self.fps, 2) if self.fps else None,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.decision()
+        del stats["status"]
+        stats.update(
+            {
+                "enabled": self.enabled,
+                "target_fps": self.target_fps,
+                "target_latency_ms": self.target_latency_ms,
+                "steps_level": self.steps_level,
+                "resolution_level": self.resolution_level,
+                "frames": self.frames,
+                "changes": self.changes,
+            }
+        )
+        return stats
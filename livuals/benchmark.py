@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""Microbenchmarks del camino de frames (no necesitan GPU ni StreamDiffusion).
+
+Uso:
+    python benchmark.py ingest|frames|spout|blend|pool|all [--iterations N]
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from blending import FrameBlender
+from frames import Frame, RGBAConverter
+from pipeline_pool import PipelinePool, resolution_buckets
+from util import bytes_to_pil, decode_frame, pil_to_frame
+
+try:
+    import torch
+except Exception:
+    torch = None  # type: ignore
+
+
+def _timeit(fn, iterations: int) -> float:
+    """Devuelve el tiempo medio en milisegundos"""
+    fn()  # warmup
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def _test_jpeg(width: int, height: int) -> bytes:
+    # Gradiente con ruido para que el JPEG tenga un tamaño realista
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.integers(0, 32, size=(height, width, 3))
+    array = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(array).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def bench_ingest(iterations: int):
+    print("\n===== INGEST: decode completo + resize vs decode reducido =====\n")
+    for src in [(640, 480), (1280, 720), (1920, 1080)]:
+        data = _test_jpeg(*src)
+        for target in [(384, 384), (512, 512)]:
+
+            def legacy():
+                # Camino anterior: bytes_to_pil + resize BICUBIC + conversión a numpy
+                image = bytes_to_pil(data).convert("RGB")
+                image = image.resize(target, Image.BICUBIC)
+                return np.array(image)
+
+            def reduced():
+                return decode_frame(data, *target)
+
+            t_legacy = _timeit(legacy, iterations)
+            t_reduced = _timeit(reduced, iterations)
+            print(
+                f"{src[0]}x{src[1]} -> {target[0]}x{target[1]}: "
+                f"actual {t_legacy:.2f} ms | reducido {t_reduced:.2f} ms | "
+                f"x{t_legacy / t_reduced:.1f}"
+            )
+    print()
+
+
+def _peak_kb(fn) -> float:
+    """Pico de memoria (KB) asignada por numpy/PIL/Python durante fn(), en
+    régimen: los buffers que se reservan una sola vez quedan en el warmup"""
+    fn()  # warmup
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def _torch_kb(fn) -> float:
+    """Memoria (KB) del allocator de torch durante fn(), que tracemalloc no ve:
+    el pico del allocator CUDA o, en CPU, lo asignado según el profiler"""
+    fn()  # warmup
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        fn()
+        torch.cuda.synchronize()
+        return (torch.cuda.max_memory_allocated() - base) / 1024
+    with torch.profiler.profile(
+        activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True
+    ) as profile:
+        fn()
+    return sum(max(0, event.self_cpu_memory_usage) for event in profile.key_averages()) / 1024
+
+
+def bench_frames(iterations: int):
+    print("\n===== FRAMES: salida PIL vs Frame (tensor → blend → spout → encode) =====\n")
+    size = 512
+    rng = np.random.default_rng(0)
+    if torch is not None:
+        previous_out = torch.rand(1, 3, size, size)
+        current_out = torch.rand(1, 3, size, size)
+    else:
+        previous_out = rng.random((1, 3, size, size), dtype=np.float32)
+        current_out = rng.random((1, 3, size, size), dtype=np.float32)
+
+    def to_numpy(t):
+        return t.numpy() if torch is not None else t
+
+    def spout_bgra(img_array):
+        # Conversión de sendSpout: array RGB → BGRA int32
+        bgra = np.zeros((size, size, 4), dtype=np.int32)
+        bgra[..., 2] = img_array[..., 2]
+        bgra[..., 1] = img_array[..., 1]
+        bgra[..., 0] = img_array[..., 0]
+        bgra[..., 3] = 255
+        return bgra
+
+    def legacy(blend: bool):
+        # output_type="pil" del wrapper: tensor → numpy float → uint8 → PIL
+        def postprocess(t):
+            array = to_numpy(t)[0].transpose(1, 2, 0)
+            return Image.fromarray((array * 255).round().astype("uint8"))
+
+        output = postprocess(current_out)
+        if blend:
+            # blend_frames: PIL → numpy → float32 → PIL
+            a = np.array(postprocess(previous_out)).astype(np.float32)
+            b = np.array(output).astype(np.float32)
+            output = Image.fromarray(np.clip(a * 0.5 + b * 0.5, 0, 255).astype(np.uint8))
+        # sendSpout: copia PIL → numpy
+        spout_bgra(np.array(output.copy()))
+        return pil_to_frame(output)
+
+    def frame_path(blend: bool):
+        def postprocess(t):
+            if torch is not None:
+                return Frame.from_tensor(t)
+            return Frame.from_array((t[0].transpose(1, 2, 0) * 255).round().astype("uint8"))
+
+        output = postprocess(current_out)
+        if blend:
+            # blend_frames: el FrameBlender de img2img (lerp en el device o punto fijo uint8)
+            output = blender.blend(postprocess(previous_out), output, 0.5)
+        converter.convert(output)
+        return pil_to_frame(output.to_pil())
+
+    converter = RGBAConverter()
+    blender = FrameBlender()
+
+    source = "tensor torch" if torch is not None else "array numpy"
+    print(f"{size}x{size}, salida del modelo como {source}")
+    for blend in (False, True):
+        print("con blend (transición de steps):" if blend else "frame normal:")
+        for name, fn in [("PIL (actual)", legacy), ("Frame", frame_path)]:
+            run = lambda: fn(blend)
+            print(f"{name:>14}: {_timeit(run, iterations):.2f} ms | pico {_peak_kb(run):.0f} KB")
+    print()
+
+
+class StubSpoutSender:
+    """SpoutSender de mentira para Linux: como el binding de PySpout, pasa la
+    imagen a un buffer contiguo uint8 (copia si viene en otro dtype)"""
+
+    def __init__(self, width: int, height: int):
+        self.target = np.empty((height, width, 4), dtype=np.uint8)
+        self.frames = 0
+
+    def send_image(self, image: np.ndarray, flip: bool):
+        np.copyto(self.target, np.ascontiguousarray(image, dtype=np.uint8))
+        self.frames += 1
+
+
+def bench_spout(iterations: int):
+    print("\n===== SPOUT: conversión int32 por canal vs RGBAConverter uint8 =====\n")
+    for size in (512, 768, 1024):
+        rng = np.random.default_rng(0)
+        array = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+        image = Image.fromarray(array)
+        sender = StubSpoutSender(size, size)
+        tensor = None
+        if torch is not None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            tensor = torch.from_numpy(array).to(device).permute(2, 0, 1).float().div(255)
+
+        def model_output_pil():
+            # output_type="pil" del wrapper: tensor → numpy float → uint8 → PIL
+            if tensor is None:
+                return image
+            output = tensor.permute(1, 2, 0).cpu().numpy()
+            return Image.fromarray((output * 255).round().astype("uint8"))
+
+        def legacy():
+            # sendSpout anterior: salida PIL del modelo, copia PIL → numpy,
+            # int32 nuevo, un canal por vez
+            img_array = np.array(model_output_pil().copy())
+            bgra = np.zeros((size, size, 4), dtype=np.int32)
+            bgra[..., 2] = img_array[..., 2]
+            bgra[..., 1] = img_array[..., 1]
+            bgra[..., 0] = img_array[..., 0]
+            bgra[..., 3] = 255
+            sender.send_image(bgra, False)
+
+        converter = RGBAConverter()
+
+        def from_array():
+            sender.send_image(converter.convert(array), False)
+
+        cases = [("int32 (actual)", legacy), ("uint8 array", from_array)]
+        if tensor is not None:
+
+            def from_frame():
+                # Como SpoutSink.send: salida del modelo como Frame → to_array
+                # (cuantización en el device, una copia a host) → converter
+                sender.send_image(converter.convert(Frame.from_tensor(tensor)), False)
+
+            cases.append((f"Frame {device}", from_frame))
+        origin = "del tensor del modelo (incluye tensor → PIL)" if tensor is not None else "de un PIL ya armado"
+        print(f"{size}x{size}, int32 (actual) parte {origin}:")
+        for name, fn in cases:
+            memory = f"pico {_peak_kb(fn):.0f} KB"
+            if name.startswith("Frame"):
+                memory += f" + torch {_torch_kb(fn):.0f} KB"
+            print(f"{name:>16}: {_timeit(fn, iterations):.2f} ms | {memory}")
+        print(f"{'':>16}  buffers asignados por el converter: {converter.allocations}")
+    print()
+
+
+def bench_blend(iterations: int):
+    print("\n===== BLEND: transición de steps a 512x512 =====\n")
+    size = 512
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    b = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    frame_a, frame_b = Frame.from_array(a), Frame.from_array(b)
+    blender = FrameBlender()
+
+    def legacy():
+        # blend_frames anterior: float32 por frame, clip y vuelta a uint8
+        array1 = frame_a.to_array().astype(np.float32)
+        array2 = frame_b.to_array().astype(np.float32)
+        blended = np.clip(array1 * 0.7 + array2 * 0.3, 0, 255).astype(np.uint8)
+        return Frame.from_array(blended)
+
+    cases = [
+        ("float32 (actual)", legacy),
+        ("punto fijo uint8", lambda: blender.blend(frame_a, frame_b, 0.3)),
+    ]
+    if torch is not None:
+        tensor_a = Frame.from_tensor(torch.from_numpy(a).permute(2, 0, 1).float().div(255))
+        tensor_b = Frame.from_tensor(torch.from_numpy(b).permute(2, 0, 1).float().div(255))
+        # Latentes de SD para 512x512: (1, 4, 64, 64)
+        latent_a = torch.randn(1, 4, size // 8, size // 8)
+        latent_b = torch.randn(1, 4, size // 8, size // 8)
+        cases += [
+            ("lerp tensor", lambda: blender.blend(tensor_a, tensor_b, 0.3)),
+            ("lerp latente", lambda: blender.blend_latents(latent_a, latent_b, 0.3)),
+        ]
+    for name, fn in cases:
+        print(f"{name:>18}: {_timeit(fn, iterations):.3f} ms | pico {_peak_kb(fn):.0f} KB")
+    print(f"{'':>18}  buffers scratch del blender: {blender.stats()['scratch_buffers']}")
+    print("(lerp tensor/latente en CPU; con CUDA corren en el device sin copias a host)")
+    print()
+
+
+class StubStreamWrapper:
+    """StreamDiffusionWrapper de mentira: armarlo tarda `build_s` (carga del
+    modelo + warmup) y ocupa width * height * 1 KB de "VRAM" """
+
+    memory = 0
+
+    def __init__(self, width: int, height: int, build_s: float = 0.2):
+        time.sleep(build_s)
+        self.size = width * height * 1024
+        StubStreamWrapper.memory += self.size
+
+    def release(self):
+        StubStreamWrapper.memory -= self.size
+
+
+def bench_pool(iterations: int):
+    print("\n===== POOL: cambio de resolución reconstruyendo vs pool de pipelines =====\n")
+    build_s = 0.2
+    switches = [(512, 512), (384, 384), (512, 512), (256, 256), (384, 384), (512, 512)]
+    for budget_mb in (0, 256, 1024):
+        StubStreamWrapper.memory = 0
+        pool = PipelinePool(
+            lambda bucket, wait_idle: StubStreamWrapper(*bucket, build_s=build_s),
+            budget_bytes=budget_mb * 2**20,
+            memory=lambda: StubStreamWrapper.memory,
+            release=lambda wrapper: wrapper.release(),
+        )
+        times = []
+        for bucket in switches:
+            start = time.perf_counter()
+            pool.acquire(bucket)
+            times.append((time.perf_counter() - start) * 1000)
+        stats = pool.stats()
+        print(
+            f"presupuesto {budget_mb:>5} MB: {' '.join(f'{t:6.1f}' for t in times)} ms | "
+            f"hits {stats['hits']} misses {stats['misses']} desalojos {stats['evictions']} "
+            f"| en uso {stats['mb']} MB"
+        )
+    StubStreamWrapper.memory = 0
+    pool = PipelinePool(
+        lambda bucket, wait_idle: StubStreamWrapper(*bucket, build_s=0.01),
+        budget_bytes=4096 * 2**20,
+        memory=lambda: StubStreamWrapper.memory,
+    )
+    pool.prewarm(resolution_buckets()).join()
+    print(f"prewarm de la grilla completa: {len(pool)} buckets, {pool.stats()['mb']} MB")
+    print()
+
+
+BENCHMARKS = {
+    "ingest": bench_ingest,
+    "frames": bench_frames,
+    "spout": bench_spout,
+    "blend": bench_blend,
+    "pool": bench_pool,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Livuals frame path benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    names = sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]
+    for name in names:
+        BENCHMARKS[name](args.iterations)
@@ -0,0 +1,91 @@
+import itertools
+from typing import Any, Dict, Optional, Tuple
+
+from connection_manager import FrameMailbox
+from encoder import EncodedFrame, FrameEncoder
+
+
+class SharedFrame:
+    """Un frame de salida codificado una sola vez y compartido por todos los visores.
+
+    Todos reciben el mismo objeto: las representaciones (imagen sola o parte
+    multipart) se arman la primera vez que alguien las pide y quedan cacheadas.
+    Cuando el último visor suelta la referencia, Python libera los bytes.
+    """
+
+    __slots__ = ("encoded", "multipart_ready", "seq", "_payload", "_multipart")
+
+    def __init__(self, encoded: EncodedFrame, multipart_ready: bool, seq: Optional[int] = None):
+        self.encoded = encoded
+        # True si encoded.data ya es una parte multipart (salida MJPEG del productor)
+        self.multipart_ready = multipart_ready
+        self.seq = seq
+        self._payload: Optional[bytes] = None
+        self._multipart: Optional[bytes] = None
+
+    def payload(self) -> bytes:
+        if self._payload is None:
+            self._payload = bytes(self.encoded.payload)
+        return self._payload
+
+    def multipart(self, encoder: FrameEncoder) -> bytes:
+        if self.multipart_ready:
+            return self.encoded.data
+        if self._multipart is None:
+            self._multipart = encoder.multipart(self.encoded.payload)
+        return self._multipart
+
+
+class Broadcaster:
+    """Reparte la salida de una sesión productora a cualquier cantidad de visores.
+
+    Cada visor tiene su propio buzón `latest`: un visor lento solo pierde
+    frames (superseded), nunca frena al productor ni al resto de los visores.
+    """
+
+    def __init__(self):
+        self._viewers: Dict[int, FrameMailbox] = {}
+        self._ids = itertools.count(1)
+        self.closed = False
+        self.published = 0
+        self.viewers_total = 0
+
+    @property
+    def has_viewers(self) -> bool:
+        return bool(self._viewers)
+
+    def __len__(self) -> int:
+        return len(self._viewers)
+
+    def subscribe(self) -> Tuple[int, FrameMailbox]:
+        slot = FrameMailbox("latest", count_drops=False)
+        if self.closed:
+            slot.close()
+        viewer_id = next(self._ids)
+        self._viewers[viewer_id] = slot
+        self.viewers_total += 1
+        return viewer_id, slot
+
+    def unsubscribe(self, viewer_id: int):
+        slot = self._viewers.pop(viewer_id, None)
+        if slot is not None:
+            slot.close()
+
+    def publish(self, frame: SharedFrame):
+        self.published += 1
+        for slot in list(self._viewers.values()):
+            slot.put(frame)
+
+    def close(self):
+        """La sesión productora terminó: los visores reciben None y cortan"""
+        self.closed = True
+        for slot in list(self._viewers.values()):
+            slot.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "viewers": len(self._viewers),
+            "viewers_total": self.viewers_total,
+            "published": self.published,
+            "superseded": sum(slot.superseded for slot in self._viewers.values()),
+        }
@@ -17,6 +17,28 @@ class Args(NamedTuple):
     debug: bool
     acceleration: str
     engine_dir: str
+    mailbox_policy: str
+    mailbox_size: int
+    batch_window_ms: float
+    max_batch_size: int
+    max_input_pixels: int
+    output_format: str
+    output_quality: int
+    chroma_subsampling: str
+    encoder_workers: int
+    pipelined: bool
+    target_fps: float
+    target_latency_ms: float
+    adaptive_min_quality: int
+    flow_credits: int
+    record_path: str
+    shm_output: str
+    shm_slots: int
+    latent_blend: bool
+    schedule_cache_size: int
+    prompt_cache_mb: float
+    pipeline_pool_mb: float
+    prewarm_buckets: str
 
     def pretty_print(self):
         print("\n")
@@ -31,6 +53,28 @@ SAFETY_CHECKER = os.environ.get("SAFETY_CHECKER", None) == "True"
 USE_TAESD = os.environ.get("USE_TAESD", "True") == "True"
 ENGINE_DIR = os.environ.get("ENGINE_DIR", "engines")
 ACCELERATION = os.environ.get("ACCELERATION", "tensorrt")
+MAILBOX_POLICY = os.environ.get("MAILBOX_POLICY", "latest")
+MAILBOX_SIZE = int(os.environ.get("MAILBOX_SIZE", 1))
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", 5))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 1))
+MAX_INPUT_PIXELS = int(os.environ.get("MAX_INPUT_PIXELS", 3840 * 2160))
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "jpeg")
+OUTPUT_QUALITY = int(os.environ.get("OUTPUT_QUALITY", 75))
+CHROMA_SUBSAMPLING = os.environ.get("CHROMA_SUBSAMPLING", "4:2:0")
+ENCODER_WORKERS = int(os.environ.get("ENCODER_WORKERS", 2))
+PIPELINED = os.environ.get("PIPELINED", None) == "True"
+TARGET_FPS = float(os.environ.get("TARGET_FPS", 0))
+TARGET_LATENCY_MS = float(os.environ.get("TARGET_LATENCY_MS", 0))
+ADAPTIVE_MIN_QUALITY = int(os.environ.get("ADAPTIVE_MIN_QUALITY", 40))
+FLOW_CREDITS = int(os.environ.get("FLOW_CREDITS", 2))
+RECORD_PATH = os.environ.get("RECORD_PATH", None)
+SHM_OUTPUT = os.environ.get("SHM_OUTPUT", None)
+SHM_SLOTS = int(os.environ.get("SHM_SLOTS", 3))
+LATENT_BLEND = os.environ.get("LATENT_BLEND", None) == "True"
+SCHEDULE_CACHE_SIZE = int(os.environ.get("SCHEDULE_CACHE_SIZE", 64))
+PROMPT_CACHE_MB = float(os.environ.get("PROMPT_CACHE_MB", 64))
+PIPELINE_POOL_MB = float(os.environ.get("PIPELINE_POOL_MB", 0))
+PREWARM_BUCKETS = os.environ.get("PREWARM_BUCKETS", None)
 
 default_host = os.getenv("HOST", "0.0.0.0")
 default_port = int(os.getenv("PORT", "7860"))
@@ -104,6 +148,168 @@ parser.add_argument(
     default=ENGINE_DIR,
     help="Engine Dir",
 )
+parser.add_argument(
+    "--mailbox-policy",
+    dest="mailbox_policy",
+    type=str,
+    default=MAILBOX_POLICY,
+    choices=["latest", "fifo", "drop_oldest"],
+    help="Frame mailbox policy per session",
+)
+parser.add_argument(
+    "--mailbox-size",
+    dest="mailbox_size",
+    type=int,
+    default=MAILBOX_SIZE,
+    help="Frame mailbox capacity (ignored by the latest policy)",
+)
+parser.add_argument(
+    "--batch-window-ms",
+    dest="batch_window_ms",
+    type=float,
+    default=BATCH_WINDOW_MS,
+    help="Time window to collect frames from several sessions into one batch",
+)
+parser.add_argument(
+    "--max-batch-size",
+    dest="max_batch_size",
+    type=int,
+    default=MAX_BATCH_SIZE,
+    help=(
+        "Max frames per batched inference call (1 disables batching). Every call runs N frames "
+        "(padded if fewer sessions); with N>1 each resolution also keeps a 1-frame pipeline for a "
+        "lone session, at about twice the GPU memory"
+    ),
+)
+parser.add_argument(
+    "--max-input-pixels",
+    dest="max_input_pixels",
+    type=int,
+    default=MAX_INPUT_PIXELS,
+    help="Reject uploaded frames larger than this many pixels (0 disables the limit)",
+)
+parser.add_argument(
+    "--output-format",
+    dest="output_format",
+    type=str,
+    default=OUTPUT_FORMAT,
+    choices=["jpeg", "webp"],
+    help="Output stream image format",
+)
+parser.add_argument(
+    "--output-quality",
+    dest="output_quality",
+    type=int,
+    default=OUTPUT_QUALITY,
+    help="Output stream image quality (1-100)",
+)
+parser.add_argument(
+    "--chroma-subsampling",
+    dest="chroma_subsampling",
+    type=str,
+    default=CHROMA_SUBSAMPLING,
+    choices=["4:4:4", "4:2:2", "4:2:0"],
+    help="JPEG chroma subsampling",
+)
+parser.add_argument(
+    "--encoder-workers",
+    dest="encoder_workers",
+    type=int,
+    default=ENCODER_WORKERS,
+    help="Threads used to encode output frames",
+)
+parser.add_argument(
+    "--pipelined",
+    dest="pipelined",
+    action="store_true",
+    default=PIPELINED,
+    help="Overlap decode, inference, encode and send of consecutive frames",
+)
+parser.add_argument(
+    "--target-fps",
+    dest="target_fps",
+    type=float,
+    default=TARGET_FPS,
+    help="Adapt quality, steps and resolution to keep this FPS per session (0 disables)",
+)
+parser.add_argument(
+    "--target-latency-ms",
+    dest="target_latency_ms",
+    type=float,
+    default=TARGET_LATENCY_MS,
+    help="Adapt quality, steps and resolution to keep frame latency under this (0 disables)",
+)
+parser.add_argument(
+    "--adaptive-min-quality",
+    dest="adaptive_min_quality",
+    type=int,
+    default=ADAPTIVE_MIN_QUALITY,
+    help="Lowest output quality the adaptive controller may use",
+)
+parser.add_argument(
+    "--flow-credits",
+    dest="flow_credits",
+    type=int,
+    default=FLOW_CREDITS,
+    help="Max frames in flight per session with ?flow=credit",
+)
+parser.add_argument(
+    "--record-path",
+    dest="record_path",
+    type=str,
+    default=RECORD_PATH,
+    help="Record the output to this MJPEG file (off the inference thread)",
+)
+parser.add_argument(
+    "--shm-output",
+    dest="shm_output",
+    type=str,
+    default=SHM_OUTPUT,
+    help="Publish raw RGBA frames to this POSIX shared-memory segment (read with shm_reader.py)",
+)
+parser.add_argument(
+    "--shm-slots",
+    dest="shm_slots",
+    type=int,
+    default=SHM_SLOTS,
+    help="Ring buffer slots for --shm-output",
+)
+parser.add_argument(
+    "--latent-blend",
+    dest="latent_blend",
+    action="store_true",
+    default=LATENT_BLEND,
+    help="Blend step transitions in latent space, before the VAE decode",
+)
+parser.add_argument(
+    "--schedule-cache-size",
+    dest="schedule_cache_size",
+    type=int,
+    default=SCHEDULE_CACHE_SIZE,
+    help="Prepared denoising schedules kept per step count (0 disables the cache)",
+)
+parser.add_argument(
+    "--prompt-cache-mb",
+    dest="prompt_cache_mb",
+    type=float,
+    default=PROMPT_CACHE_MB,
+    help="Memory budget for cached prompt embeddings, shared by all sessions",
+)
+parser.add_argument(
+    "--pipeline-pool-mb",
+    dest="pipeline_pool_mb",
+    type=float,
+    default=PIPELINE_POOL_MB,
+    help="GPU memory kept for idle pipelines of other resolutions (0: only the active one)",
+)
+parser.add_argument(
+    "--prewarm-buckets",
+    dest="prewarm_buckets",
+    type=str,
+    default=PREWARM_BUCKETS,
+    help="Resolutions to build in the background at startup: 'all', 'ready' (TensorRT engines "
+    "listed in engine_dir/manifest.json) or e.g. '512x512,384x384'",
+)
 parser.set_defaults(taesd=USE_TAESD)
 config = Args(**vars(parser.parse_args()))
 config.pretty_print()
@@ -1,12 +1,18 @@
-from typing import Dict, Union
+from typing import Any, Deque, Dict, Optional, Union
+from collections import deque
 from uuid import UUID
 import asyncio
 from fastapi import WebSocket
 from starlette.websockets import WebSocketState
 import logging
 from types import SimpleNamespace
+from metrics import FRAMES_DROPPED
+from flow import CreditWindow
+from protocol import FLOW_CREDIT, FLOW_LOCKSTEP, OUTPUT_MJPEG, PROTOCOL_LEGACY
 
-Connections = Dict[UUID, Dict[str, Union[WebSocket, asyncio.Queue]]]
+Connections = Dict[UUID, Dict[str, Union[WebSocket, "FrameMailbox"]]]
+
+MAILBOX_POLICIES = ("latest", "fifo", "drop_oldest")
 
 
 class ServerFullException(Exception):
@@ -15,12 +21,101 @@ class ServerFullException(Exception):
     pass
 
 
+class FrameMailbox:
+    """Buzón acotado de frames entrantes de una sesión.
+
+    Políticas:
+    - latest: capacidad 1, el frame nuevo reemplaza al pendiente (superseded)
+    - fifo: cola acotada, los frames que llegan con la cola llena se descartan (dropped)
+    - drop_oldest: cola acotada, al llenarse se descarta el frame más viejo (dropped)
+
+    Al cerrarlo (la sesión se desconectó) `get` deja de esperar y devuelve None.
+    """
+
+    def __init__(self, policy: str = "latest", capacity: int = 1, count_drops: bool = True):
+        if policy not in MAILBOX_POLICIES:
+            raise ValueError(f"Unknown mailbox policy: {policy}")
+        self.policy = policy
+        self.capacity = 1 if policy == "latest" else max(1, capacity)
+        self._items: Deque[Any] = deque()
+        self._event = asyncio.Event()
+        self.closed = False
+        # False para buzones que no son de entrada (p.ej. visores de broadcast)
+        self.count_drops = count_drops
+        self.received = 0
+        self.dropped = 0
+        self.superseded = 0
+
+    def put(self, item: Any):
+        self.received += 1
+        if len(self._items) >= self.capacity:
+            if self.policy == "latest":
+                self._items.clear()
+                self.superseded += 1
+                self._count_drop("superseded")
+            elif self.policy == "drop_oldest":
+                self._items.popleft()
+                self.dropped += 1
+                self._count_drop("dropped")
+            else:
+                self.dropped += 1
+                self._count_drop("dropped")
+                return
+        self._items.append(item)
+        self._event.set()
+
+    def _count_drop(self, reason: str):
+        if self.count_drops:
+            FRAMES_DROPPED.inc(1, reason)
+
+    async def get(self) -> Any:
+        while not self._items:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        item = self._items.popleft()
+        if not self._items:
+            self._event.clear()
+        return item
+
+    def clear(self):
+        self._items.clear()
+
+    def close(self):
+        self.closed = True
+        self._items.clear()
+        self._event.set()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "capacity": self.capacity,
+            "pending": len(self._items),
+            "received": self.received,
+            "dropped": self.dropped,
+            "superseded": self.superseded,
+        }
+
+
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, mailbox_policy: str = "latest", mailbox_size: int = 1, flow_credits: int = 2):
         self.active_connections: Connections = {}
+        self.mailbox_policy = mailbox_policy
+        self.mailbox_size = mailbox_size
+        self.flow_credits = flow_credits
 
     async def connect(
-        self, user_id: UUID, websocket: WebSocket, max_queue_size: int = 0
+        self,
+        user_id: UUID,
+        websocket: WebSocket,
+        max_queue_size: int = 0,
+        protocol: str = PROTOCOL_LEGACY,
+        output: str = OUTPUT_MJPEG,
+        flow: str = FLOW_LOCKSTEP,
     ):
         await websocket.accept()
         user_count = self.get_user_count()
@@ -31,15 +126,27 @@ class ConnectionManager:
             await websocket.close()
             raise ServerFullException("Server is full")
         print(f"New user connected: {user_id}")
+        credits = CreditWindow(self.flow_credits) if flow == FLOW_CREDIT else None
         self.active_connections[user_id] = {
             "websocket": websocket,
-            "queue": asyncio.Queue(),
+            "queue": FrameMailbox(self.mailbox_policy, self.mailbox_size),
+            "protocol": protocol,
+            "output": output,
+            "credits": credits,
         }
         await websocket.send_json(
-            {"status": "connected", "message": "Connected"},
+            {
+                "status": "connected",
+                "message": "Connected",
+                "protocol": protocol,
+                "output": output,
+                "flow": flow,
+            },
         )
         await websocket.send_json({"status": "wait"})
         await websocket.send_json({"status": "send_frame"})
+        if credits is not None:
+            credits.grant()
 
     def check_user(self, user_id: UUID) -> bool:
         return user_id in self.active_connections
@@ -47,31 +154,59 @@ class ConnectionManager:
     async def update_data(self, user_id: UUID, new_data: SimpleNamespace):
         user_session = self.active_connections.get(user_id)
         if user_session:
-            queue = user_session["queue"]
-            await queue.put(new_data)
+            user_session["queue"].put(new_data)
 
-    async def get_latest_data(self, user_id: UUID) -> SimpleNamespace:
+    async def get_latest_data(self, user_id: UUID) -> Optional[SimpleNamespace]:
+        """Espera el próximo frame de la sesión. None si la sesión ya no existe"""
         user_session = self.active_connections.get(user_id)
         if user_session:
-            queue = user_session["queue"]
-            try:
-                return await queue.get()
-            except asyncio.QueueEmpty:
-                return None
+            return await user_session["queue"].get()
+        return None
+
+    def get_protocol(self, user_id: UUID) -> str:
+        user_session = self.active_connections.get(user_id)
+        if user_session:
+            return user_session["protocol"]
+        return PROTOCOL_LEGACY
+
+    def get_output(self, user_id: UUID) -> str:
+        user_session = self.active_connections.get(user_id)
+        if user_session:
+            return user_session["output"]
+        return OUTPUT_MJPEG
+
+    def get_credits(self, user_id: UUID) -> Optional[CreditWindow]:
+        """Ventana de créditos de la sesión, None en modo lockstep"""
+        user_session = self.active_connections.get(user_id)
+        if user_session:
+            return user_session["credits"]
+        return None
+
+    def get_pending(self, user_id: UUID) -> int:
+        user_session = self.active_connections.get(user_id)
+        if user_session:
+            return len(user_session["queue"])
+        return 0
+
+    def get_mailbox_stats(self, user_id: UUID) -> Optional[Dict[str, Any]]:
+        user_session = self.active_connections.get(user_id)
+        if user_session:
+            return user_session["queue"].stats()
+        return None
 
     def delete_user(self, user_id: UUID):
         user_session = self.active_connections.pop(user_id, None)
         if user_session:
-            queue = user_session["queue"]
-            while not queue.empty():
-                try:
-                    queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    continue
+            # Despierta al loop de inferencia que esté esperando un frame
+            user_session["queue"].close()
 
     def get_user_count(self) -> int:
         return len(self.active_connections)
 
+    def get_pending_frames(self) -> int:
+        """Frames esperando en los buzones de todas las sesiones"""
+        return sum(len(session["queue"]) for session in list(self.active_connections.values()))
+
     def get_websocket(self, user_id: UUID) -> WebSocket:
         user_session = self.active_connections.get(user_id)
         if user_session:
@@ -94,6 +229,14 @@ class ConnectionManager:
         except Exception as e:
             logging.error(f"Error: Send json: {e}")
 
+    async def send_bytes(self, user_id: UUID, data: bytes):
+        try:
+            websocket = self.get_websocket(user_id)
+            if websocket:
+                await websocket.send_bytes(data)
+        except Exception as e:
+            logging.error(f"Error: Send bytes: {e}")
+
     async def receive_json(self, user_id: UUID) -> Dict:
         try:
             websocket = self.get_websocket(user_id)
@@ -102,6 +245,28 @@ class ConnectionManager:
         except Exception as e:
             logging.error(f"Error: Receive json: {e}")
 
+    async def receive_text(self, user_id: UUID) -> str:
+        try:
+            websocket = self.get_websocket(user_id)
+            if websocket:
+                return await websocket.receive_text()
+        except Exception as e:
+            logging.error(f"Error: Receive text: {e}")
+
+    async def receive_message(self, user_id: UUID) -> Optional[Union[bytes, str]]:
+        """Siguiente mensaje, binario o de texto. None si el cliente se desconectó"""
+        try:
+            websocket = self.get_websocket(user_id)
+            if websocket:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return None
+                if message.get("bytes") is not None:
+                    return message["bytes"]
+                return message.get("text")
+        except Exception as e:
+            logging.error(f"Error: Receive message: {e}")
+
     async def receive_bytes(self, user_id: UUID) -> bytes:
         try:
             websocket = self.get_websocket(user_id)
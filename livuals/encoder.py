@@ -0,0 +1,146 @@
+import asyncio
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from PIL import Image
+
+from frames import Frame
+from metrics import STAGE_SECONDS
+
+OUTPUT_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+CHROMA_SUBSAMPLING = ("4:4:4", "4:2:2", "4:2:0")
+
+
+class EncodedFrame(NamedTuple):
+    data: bytes
+    encode_ms: float
+    # Posición de la imagen dentro de `data` (después del framing multipart o del prefix)
+    offset: int = 0
+    size: int = 0
+
+    @property
+    def payload(self) -> memoryview:
+        """La imagen codificada, sin copiar"""
+        return memoryview(self.data)[self.offset:self.offset + self.size]
+
+
+class FrameEncoder:
+    """Codifica los frames de salida en un pool chico de hilos.
+
+    Cada hilo reutiliza su propio BytesIO (no se trunca, solo se reescribe
+    desde el principio) y el framing multipart se arma con un único join,
+    sin concatenaciones intermedias.
+    """
+
+    def __init__(
+        self,
+        output_format: str = "jpeg",
+        quality: int = 75,
+        subsampling: str = "4:2:0",
+        workers: int = 2,
+    ):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.format, self.content_type = OUTPUT_FORMATS[output_format]
+        self.quality = quality
+        self.subsampling = subsampling
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="encoder"
+        )
+        self._local = threading.local()
+        self._multipart_head = (
+            f"--frame\r\nContent-Type: {self.content_type}\r\nContent-Length: "
+        ).encode()
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+
+    def _save_options(self, quality: Optional[int] = None) -> Dict[str, Any]:
+        quality = quality or self.quality
+        if self.format == "JPEG":
+            return {"quality": quality, "subsampling": self.subsampling}
+        # method=0 es el más rápido de WebP, suficiente para streaming
+        return {"quality": quality, "method": 0}
+
+    def _buffer(self) -> io.BytesIO:
+        buf = getattr(self._local, "buf", None)
+        if buf is None:
+            buf = self._local.buf = io.BytesIO()
+        buf.seek(0)
+        return buf
+
+    def _multipart_prefix(self, size: int) -> bytes:
+        return b"%s%d\r\n\r\n" % (self._multipart_head, size)
+
+    def multipart(self, payload) -> bytes:
+        """Arma la parte multipart (MJPEG) de una imagen ya codificada"""
+        return b"".join((self._multipart_prefix(len(payload)), payload, b"\r\n"))
+
+    def encode_sync(
+        self,
+        image: Image.Image,
+        multipart: bool = True,
+        prefix: Optional[Callable[[float], bytes]] = None,
+        quality: Optional[int] = None,
+    ) -> EncodedFrame:
+        """Codifica `image`. Con `prefix` (recibe el encode_ms) el resultado es
+        prefix + imagen, p.ej. el header binario del canal websocket.
+        `quality` reemplaza la calidad por defecto solo para este frame"""
+        start = time.perf_counter()
+        if isinstance(image, Frame):
+            image = image.to_pil()
+        buf = self._buffer()
+        image.save(buf, format=self.format, **self._save_options(quality))
+        size = buf.tell()
+        with buf.getbuffer() as view:
+            payload = view[:size]
+            if prefix is not None:
+                encode_ms = (time.perf_counter() - start) * 1000
+                head = prefix(encode_ms)
+                data = b"".join((head, payload))
+                offset = len(head)
+            elif multipart:
+                head = self._multipart_prefix(size)
+                data = b"".join((head, payload, b"\r\n"))
+                offset = len(head)
+            else:
+                data = bytes(payload)
+                offset = 0
+            payload.release()
+        encode_ms = (time.perf_counter() - start) * 1000
+        STAGE_SECONDS.observe(encode_ms / 1000, "encode")
+        with self._lock:
+            self.frames += 1
+            self.total_ms += encode_ms
+            self.last_ms = encode_ms
+        return EncodedFrame(data, encode_ms, offset, size)
+
+    async def encode(
+        self,
+        image: Image.Image,
+        multipart: bool = True,
+        prefix: Optional[Callable[[float], bytes]] = None,
+        quality: Optional[int] = None,
+    ) -> EncodedFrame:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.encode_sync, image, multipart, prefix, quality
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "format": self.format,
+                "quality": self.quality,
+                "subsampling": self.subsampling if self.format == "JPEG" else None,
+                "frames": self.frames,
+                "last_ms": round(self.last_ms, 3),
+                "avg_ms": round(self.total_ms / self.frames, 3) if self.frames else 0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Engines de TensorRT armados de antemano, con un manifest en engine_dir.
+
+Con --acceleration tensorrt cada resolución arma su engine la primera vez
+que se usa (minutos, en medio del set). Este script los arma offline para
+toda la grilla de width/height/steps de InputParams y anota en
+`engine_dir/manifest.json` qué hay, cuánto ocupa y cuándo se usó; el
+servidor lee el manifest al arrancar para saber qué buckets están listos.
+
+Uso:
+    python engines.py build [--buckets 512x512,384x384] [--no-hash]
+    python engines.py verify [--hash]
+    python engines.py list
+    python engines.py evict --budget-gb 20 [--dry-run]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from pipeline_pool import Bucket, parse_buckets, resolution_buckets
+
+MANIFEST_NAME = "manifest.json"
+
+
+def bucket_dir(engine_dir: str, width: int, height: int) -> str:
+    """Directorio de engines de una resolución.
+
+    Los engines se arman con shape estática (la del primer uso) pero el
+    wrapper no pone la resolución en la ruta: todos los buckets compartían
+    el mismo engine. Cada bucket usa su propio subdirectorio."""
+    return os.path.join(engine_dir, f"{width}x{height}")
+
+
+def engine_prefix(model_id: str, use_tiny_vae: bool, batch: int, use_lcm_lora: bool = False, mode: str = "img2img") -> str:
+    """Mismo nombre de directorio que arma utils/wrapper.py (create_prefix)"""
+    if os.path.exists(model_id):
+        model_id = os.path.splitext(os.path.basename(model_id))[0]
+    return (
+        f"{model_id}--lcm_lora-{use_lcm_lora}--tiny_vae-{use_tiny_vae}"
+        f"--max_batch-{batch}--min_batch-{batch}--mode-{mode}"
+    )
+
+
+def engine_paths(
+    engine_dir: str, model_id: str, use_tiny_vae: bool, width: int, height: int, batch: int, frame_buffer_size: int
+) -> List[str]:
+    """Engines de un bucket: el UNet usa el batch de denoising, los VAE el frame buffer"""
+    root = bucket_dir(engine_dir, width, height)
+    unet = os.path.join(root, engine_prefix(model_id, use_tiny_vae, batch), "unet.engine")
+    vae = os.path.join(root, engine_prefix(model_id, use_tiny_vae, frame_buffer_size))
+    return [unet, os.path.join(vae, "vae_encoder.engine"), os.path.join(vae, "vae_decoder.engine")]
+
+
+def file_sha256(path: str, chunk: int = 16 * 2**20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_files(engine_path: str) -> List[str]:
+    """El engine y sus intermedios (unet.engine.onnx, unet.engine.opt.onnx, ...)"""
+    return sorted(glob.glob(glob.escape(engine_path) + "*"))
+
+
+def entry_key(
+    model_id: str, use_tiny_vae: bool, width: int, height: int, batch: int, frame_buffer_size: int, acceleration: str
+) -> str:
+    return f"{model_id}|tiny_vae-{use_tiny_vae}|{width}x{height}|batch-{batch}|frames-{frame_buffer_size}|{acceleration}"
+
+
+def frame_buffer_sizes(max_batch_size: int) -> List[int]:
+    """Streams por bucket: el de `max_batch_size` frames por llamada y, si
+    es más de 1, otro de 1 frame para cuando hay una sola sesión (con el
+    relleno pagaría N frames por uno)"""
+    batch = max(1, max_batch_size)
+    return [batch, 1] if batch > 1 else [1]
+
+
+def steps_batches(steps: Iterable[int], t_index_list, frame_buffer_size: int) -> Dict[int, List[int]]:
+    """Batch del UNet para cada cantidad de steps → {batch: [steps, ...]}.
+
+    Con el denoising batch el UNet procesa len(t_index_list) latentes por
+    frame: los steps solo cambian el engine si cambia ese largo."""
+    batches: Dict[int, List[int]] = {}
+    for total in steps:
+        batches.setdefault(len(t_index_list(total)) * frame_buffer_size, []).append(total)
+    return batches
+
+
+class EngineManifest:
+    """Índice de los engines armados en `engine_dir` (manifest.json).
+
+    Cada entrada es una combinación modelo/resolución/batch/aceleración con
+    sus archivos (ruta relativa, bytes, sha256), los bytes en disco
+    contando los intermedios ONNX, cuándo se armó y cuándo se usó por
+    última vez. El archivo se reescribe entero y de forma atómica.
+    """
+
+    def __init__(self, engine_dir: str):
+        self.engine_dir = engine_dir
+        self.path = os.path.join(engine_dir, MANIFEST_NAME)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = dict(data.get("entries", {}))
+        except FileNotFoundError:
+            self.entries = {}
+        except (ValueError, OSError) as e:
+            print(f"Manifest de engines ilegible ({self.path}): {e}")
+            self.entries = {}
+
+    def save(self):
+        os.makedirs(self.engine_dir, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": self.entries}, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def record(
+        self,
+        model_id: str,
+        use_tiny_vae: bool,
+        width: int,
+        height: int,
+        batch: int,
+        frame_buffer_size: int,
+        acceleration: str = "tensorrt",
+        steps: Optional[List[int]] = None,
+        hash_files: bool = True,
+    ) -> Dict[str, Any]:
+        """Anota los engines de un bucket que ya están en disco"""
+        files = {}
+        disk_bytes = 0
+        for path in engine_paths(self.engine_dir, model_id, use_tiny_vae, width, height, batch, frame_buffer_size):
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            files[os.path.relpath(path, self.engine_dir)] = {
+                "bytes": os.path.getsize(path),
+                "sha256": file_sha256(path) if hash_files else None,
+            }
+            disk_bytes += sum(os.path.getsize(p) for p in artifact_files(path))
+        key = entry_key(model_id, use_tiny_vae, width, height, batch, frame_buffer_size, acceleration)
+        now = time.time()
+        previous = self.entries.get(key, {})
+        entry = {
+            "model_id": model_id,
+            "tiny_vae": use_tiny_vae,
+            "width": width,
+            "height": height,
+            "batch": batch,
+            "frame_buffer_size": frame_buffer_size,
+            "acceleration": acceleration,
+            "steps": steps if steps is not None else previous.get("steps"),
+            "files": files,
+            "disk_bytes": disk_bytes,
+            # Rearmado si cambiaron los archivos
+            "built_at": previous["built_at"] if previous.get("files") == files else now,
+            "last_used": previous.get("last_used", now),
+        }
+        with self._lock:
+            self.entries[key] = entry
+        return entry
+
+    def verify(self, key: str, hash_files: bool = False) -> List[str]:
+        """Problemas de una entrada (vacío si está bien)"""
+        problems = []
+        for rel, info in self.entries[key]["files"].items():
+            path = os.path.join(self.engine_dir, rel)
+            if not os.path.exists(path):
+                problems.append(f"falta {rel}")
+            elif os.path.getsize(path) != info["bytes"]:
+                problems.append(f"{rel}: {os.path.getsize(path)} bytes, el manifest dice {info['bytes']}")
+            elif hash_files and info.get("sha256") and file_sha256(path) != info["sha256"]:
+                problems.append(f"{rel}: sha256 distinto")
+        return problems
+
+    def touch(self, key: str):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry["last_used"] = time.time()
+        self.save()
+
+    def available(
+        self, model_id: str, use_tiny_vae: bool, batch: int, frame_buffer_size: int, acceleration: str = "tensorrt"
+    ) -> List[Bucket]:
+        """Buckets con todos sus engines en disco (por tamaño, sin hashear)"""
+        buckets = []
+        for key, entry in self.entries.items():
+            if (
+                entry["model_id"], entry["tiny_vae"], entry["batch"], entry["frame_buffer_size"], entry["acceleration"]
+            ) != (model_id, use_tiny_vae, batch, frame_buffer_size, acceleration):
+                continue
+            if not self.verify(key):
+                buckets.append((entry["width"], entry["height"]))
+        return sorted(buckets)
+
+    @property
+    def disk_bytes(self) -> int:
+        return sum(entry["disk_bytes"] for entry in self.entries.values())
+
+    def remove(self, key: str):
+        """Borra del disco los engines de la entrada (con sus intermedios)"""
+        entry = self.entries.pop(key)
+        for rel in entry["files"]:
+            path = os.path.join(self.engine_dir, rel)
+            for artifact in artifact_files(path):
+                os.remove(artifact)
+            directory = os.path.dirname(path)
+            # Subir borrando directorios vacíos hasta engine_dir
+            while os.path.abspath(directory) != os.path.abspath(self.engine_dir):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+
+    def evict(self, budget_bytes: int, keep: Iterable[str] = (), dry_run: bool = False) -> List[str]:
+        """Borra los usados hace más tiempo hasta entrar en `budget_bytes`"""
+        keep = set(keep)
+        evicted = []
+        total = self.disk_bytes
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if total <= budget_bytes:
+                break
+            if key in keep:
+                continue
+            total -= self.entries[key]["disk_bytes"]
+            evicted.append(key)
+            if not dry_run:
+                self.remove(key)
+        if evicted and not dry_run:
+            self.save()
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "disk_mb": round(self.disk_bytes / 2**20, 1),
+            "buckets": sorted(
+                f"{entry['width']}x{entry['height']}" for entry in self.entries.values()
+            ),
+        }
+
+
+def _load_img2img(args):
+    """Importa img2img para armar los engines con el mismo wrapper que el
+    servidor. config parsea sys.argv al importarse: se le pasan solo los
+    flags que afectan a los engines"""
+    argv = sys.argv
+    sys.argv = [argv[0], "--acceleration", "tensorrt", "--engine-dir", args.engine_dir,
+                "--max-batch-size", str(args.max_batch_size), "--taesd" if args.taesd else "--no-taesd"]
+    try:
+        import img2img
+    finally:
+        sys.argv = argv
+    return img2img
+
+
+def _selected_buckets(spec: Optional[str], grid: List[Bucket]) -> List[Bucket]:
+    return parse_buckets(spec, grid) if spec else list(grid)
+
+
+def _format_key(entry: Dict[str, Any]) -> str:
+    return f"{entry['width']}x{entry['height']} batch {entry['batch']}/{entry['frame_buffer_size']}"
+
+
+def cmd_build(args) -> int:
+    img2img = _load_img2img(args)
+    import torch
+
+    schema = img2img.Pipeline.InputParams.schema()["properties"]
+    width, steps = schema["width"], schema["steps"]
+    grid = resolution_buckets(width["min"], width["max"], width["step"])
+    # El servidor arma un stream por tamaño de frame buffer: engines para cada uno
+    builds = [
+        (frame_buffer_size, batch, step_values)
+        for frame_buffer_size in frame_buffer_sizes(args.max_batch_size)
+        for batch, step_values in sorted(steps_batches(
+            range(steps["min"], steps["max"] + 1, steps.get("step", 1)),
+            lambda total: img2img.StepsConfig(total).t_index_list,
+            frame_buffer_size,
+        ).items())
+    ]
+    manifest = EngineManifest(args.engine_dir)
+    device = torch.device("cuda")
+    failed = 0
+    for bucket in _selected_buckets(args.buckets, grid):
+        for frame_buffer_size, batch, step_values in builds:
+            w, h = bucket
+            paths = engine_paths(args.engine_dir, img2img.base_model, args.taesd, w, h, batch, frame_buffer_size)
+            key = entry_key(img2img.base_model, args.taesd, w, h, batch, frame_buffer_size, "tensorrt")
+            if all(os.path.exists(p) for p in paths):
+                if key in manifest.entries and not manifest.verify(key):
+                    print(f"{w}x{h} batch {batch}/{frame_buffer_size}: listo")
+                    continue
+                # Armado por el servidor o por una corrida anterior sin manifest
+                manifest.record(
+                    img2img.base_model, args.taesd, w, h, batch, frame_buffer_size,
+                    steps=step_values, hash_files=args.hash,
+                )
+                manifest.save()
+                print(f"{w}x{h} batch {batch}/{frame_buffer_size}: ya estaba, anotado")
+                continue
+            start = time.perf_counter()
+            try:
+                stream = img2img.build_stream_wrapper(
+                    img2img.base_model, args.taesd, device, torch.float16,
+                    img2img.StepsConfig(step_values[0]).t_index_list, frame_buffer_size,
+                    w, h, "tensorrt", args.engine_dir, warmup=0,
+                )
+                del stream
+                torch.cuda.empty_cache()
+                manifest.record(
+                    img2img.base_model, args.taesd, w, h, batch, frame_buffer_size,
+                    steps=step_values, hash_files=args.hash,
+                )
+                manifest.save()
+            except Exception as e:
+                failed += 1
+                print(f"{w}x{h} batch {batch}/{frame_buffer_size}: error {e}")
+                continue
+            print(f"{w}x{h} batch {batch}/{frame_buffer_size}: armado en {time.perf_counter() - start:.1f}s")
+    print(f"Manifest: {len(manifest)} entradas, {manifest.disk_bytes / 2**30:.2f} GB en {manifest.path}")
+    return 1 if failed else 0
+
+
+def cmd_verify(args) -> int:
+    manifest = EngineManifest(args.engine_dir)
+    bad = 0
+    for key, entry in sorted(manifest.entries.items()):
+        problems = manifest.verify(key, hash_files=args.hash)
+        if problems:
+            bad += 1
+            print(f"{_format_key(entry)}: " + "; ".join(problems))
+        else:
+            print(f"{_format_key(entry)}: ok")
+    if bad and args.prune:
+        for key in [k for k in manifest.entries if manifest.verify(k)]:
+            del manifest.entries[key]
+        manifest.save()
+        print(f"{bad} entradas quitadas del manifest")
+    return 1 if bad and not args.prune else 0
+
+
+def cmd_list(args) -> int:
+    manifest = EngineManifest(args.engine_dir)
+    for key, entry in sorted(manifest.entries.items(), key=lambda item: -item[1]["last_used"]):
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"]))
+        print(f"{_format_key(entry):<24} {entry['disk_bytes'] / 2**20:>9.1f} MB  usado {used}  {entry['model_id']}")
+    print(f"Total: {len(manifest)} entradas, {manifest.disk_bytes / 2**30:.2f} GB")
+    return 0
+
+
+def cmd_evict(args) -> int:
+    manifest = EngineManifest(args.engine_dir)
+    evicted = manifest.evict(int(args.budget_gb * 2**30), dry_run=args.dry_run)
+    for key in evicted:
+        print(("se borraría " if args.dry_run else "borrado ") + key)
+    print(f"Total: {len(manifest)} entradas, {manifest.disk_bytes / 2**30:.2f} GB")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Livuals TensorRT engine prebuild")
+    parser.add_argument("--engine-dir", dest="engine_dir", default=os.environ.get("ENGINE_DIR", "engines"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build missing engines for the InputParams grid")
+    build.add_argument("--buckets", default=None, help="Only these resolutions, e.g. '512x512,384x384'")
+    build.add_argument("--max-batch-size", dest="max_batch_size", type=int,
+                       default=int(os.environ.get("MAX_BATCH_SIZE", 1)))
+    build.add_argument("--taesd", dest="taesd", action="store_true")
+    build.add_argument("--no-taesd", dest="taesd", action="store_false")
+    build.add_argument("--no-hash", dest="hash", action="store_false", help="Skip sha256 of the engines")
+    build.set_defaults(taesd=os.environ.get("USE_TAESD", "True") == "True", func=cmd_build)
+
+    verify = commands.add_parser("verify", help="Check the engines listed in the manifest")
+    verify.add_argument("--hash", action="store_true", help="Also recompute sha256")
+    verify.add_argument("--prune", action="store_true", help="Drop broken entries from the manifest")
+    verify.set_defaults(func=cmd_verify)
+
+    commands.add_parser("list", help="Show the manifest").set_defaults(func=cmd_list)
+
+    evict = commands.add_parser("evict", help="Delete least recently used engines down to a disk budget")
+    evict.add_argument("--budget-gb", dest="budget_gb", type=float, required=True)
+    evict.add_argument("--dry-run", dest="dry_run", action="store_true")
+    evict.set_defaults(func=cmd_evict)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
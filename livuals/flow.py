@@ -0,0 +1,94 @@
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class CreditWindow:
+    """Control de flujo por créditos de una sesión (`?flow=credit`).
+
+    Cada `send_frame` es un crédito: el cliente responde con un frame por
+    crédito, así que los clientes actuales funcionan sin cambios. El servidor
+    mantiene hasta `window` frames en vuelo (pedidos y no recibidos, más los
+    que esperan en el buzón) para que al terminar `predict` el siguiente ya
+    esté esperando en vez de pagar un ida y vuelta de red por frame.
+
+    La ventana se adapta al RTT medido (pedido → llegada del frame) y al
+    tiempo de servicio (intervalo entre frames consumidos):
+    window = 1 + ceil(rtt / servicio), acotada a [1, max_window].
+    """
+
+    def __init__(self, max_window: int = 2, initial_window: Optional[int] = None, smoothing: float = 0.2):
+        self.max_window = max(1, max_window)
+        self.window = min(self.max_window, initial_window or self.max_window)
+        self.smoothing = smoothing
+        self.outstanding = 0
+        self.rtt: Optional[float] = None
+        self.service: Optional[float] = None
+        self.granted_total = 0
+        self.arrived_total = 0
+        self.stalls = 0
+        self._grants: Deque[float] = deque()
+        self._last_consumed: Optional[float] = None
+
+    def grant(self) -> None:
+        """Registra un send_frame enviado"""
+        self.outstanding += 1
+        self.granted_total += 1
+        self._grants.append(time.time())
+
+    def needed(self, pending: int) -> int:
+        """Créditos a otorgar para completar la ventana, dado lo que espera en el buzón"""
+        return max(0, self.window - self.outstanding - pending)
+
+    def arrived(self) -> Optional[float]:
+        """Llegó un frame (o una respuesta vacía): devuelve cuándo se pidió"""
+        self.arrived_total += 1
+        if not self._grants:
+            return None
+        self.outstanding -= 1
+        granted_at = self._grants.popleft()
+        self.rtt = self._ewma(self.rtt, time.time() - granted_at)
+        self._adapt()
+        return granted_at
+
+    def consumed(self) -> None:
+        """El loop de inferencia sacó un frame del buzón"""
+        now = time.time()
+        if self._last_consumed is not None:
+            self.service = self._ewma(self.service, now - self._last_consumed)
+        self._last_consumed = now
+        self._adapt()
+
+    def stall_timeout(self) -> float:
+        """Tiempo máximo esperando frames pedidos antes de darlos por perdidos"""
+        return max(1.0, 4 * (self.rtt or 0.25))
+
+    def reset(self) -> None:
+        """Los créditos pendientes no llegaron: se descartan y se vuelven a otorgar"""
+        self.stalls += 1
+        self.outstanding = 0
+        self._grants.clear()
+        self._last_consumed = None
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
+
+    def _adapt(self):
+        if self.rtt is None or not self.service:
+            return
+        self.window = max(1, min(self.max_window, 1 + math.ceil(self.rtt / self.service)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window": self.window,
+            "max_window": self.max_window,
+            "outstanding": self.outstanding,
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "service_ms": round(self.service * 1000, 1) if self.service else None,
+            "granted": self.granted_total,
+            "arrived": self.arrived_total,
+            "stalls": self.stalls,
+        }
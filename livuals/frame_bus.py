@@ -0,0 +1,222 @@
+"""Bus de frames de salida del pipeline.
+
+`Pipeline.predict` publica cada frame terminado y sigue: cada sink (Spout,
+grabador a archivo, memoria compartida, ...) corre en su propio hilo con un
+buzón de un solo frame. Si un sink es lento se queda con el último frame y
+pierde los intermedios; si falla se reinicia en su hilo. Nada de eso frena
+la inferencia.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from frames import Frame
+from metrics import STAGE_SECONDS
+
+
+class FrameSink:
+    """Destino de frames. `send` corre en el hilo del sink, nunca en el de inferencia"""
+
+    name = "sink"
+
+    def open(self):
+        pass
+
+    def send(self, frame: Frame, params: Any):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def reset(self):
+        """Después de un error: cerrar y volver a abrir"""
+        self.close()
+        self.open()
+
+
+class SinkWorker:
+    """Hilo de un sink con un buzón `latest` de capacidad 1"""
+
+    def __init__(self, sink: FrameSink):
+        self.sink = sink
+        self._cond = threading.Condition()
+        self._pending: Optional[Tuple[Frame, Any]] = None
+        self._closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_ms = 0.0
+        self.last_error: Optional[str] = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"sink-{sink.name}", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, frame: Frame, params: Any):
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (frame, params)
+            self._cond.notify()
+
+    def close(self, timeout: Optional[float] = None):
+        with self._cond:
+            self._closed = True
+            self._pending = None
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _fail(self, action: str, e: Exception):
+        self.errors += 1
+        self.last_error = f"{action}: {e}"
+        logging.warning(f"Sink {self.sink.name} {action} error: {e}")
+
+    def _run(self):
+        try:
+            self.sink.open()
+        except Exception as e:
+            self._fail("open", e)
+        try:
+            while True:
+                with self._cond:
+                    while self._pending is None and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    frame, params = self._pending
+                    self._pending = None
+                start = time.perf_counter()
+                try:
+                    self.sink.send(frame, params)
+                    self.sent += 1
+                    STAGE_SECONDS.observe(time.perf_counter() - start, self.sink.name)
+                except Exception as e:
+                    self._fail("send", e)
+                    try:
+                        self.sink.reset()
+                    except Exception as reset_error:
+                        self._fail("reset", reset_error)
+                self.last_ms = (time.perf_counter() - start) * 1000
+        finally:
+            try:
+                self.sink.close()
+            except Exception as e:
+                self._fail("close", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_ms": round(self.last_ms, 3),
+            "last_error": self.last_error,
+        }
+
+
+class FrameBus:
+    def __init__(self):
+        self._workers: Dict[str, SinkWorker] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, sink: FrameSink) -> FrameSink:
+        """Agrega un sink (reemplaza al que tenga el mismo nombre)"""
+        self.unsubscribe(sink.name)
+        with self._lock:
+            self._workers[sink.name] = SinkWorker(sink)
+        return sink
+
+    def unsubscribe(self, name: str, timeout: Optional[float] = None):
+        """Quita un sink; su close() corre en su hilo. Espera hasta `timeout`
+        (None: no espera, el hilo termina solo)"""
+        with self._lock:
+            worker = self._workers.pop(name, None)
+        if worker is not None:
+            worker.close(timeout if timeout is not None else 0)
+
+    def get(self, name: str) -> Optional[FrameSink]:
+        worker = self._workers.get(name)
+        return worker.sink if worker else None
+
+    def publish(self, frame: Frame, params: Any = None):
+        """No bloquea: deja el frame en el buzón de cada sink"""
+        self.published += 1
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.put(frame, params)
+
+    def close(self, timeout: Optional[float] = None):
+        with self._lock:
+            names = list(self._workers)
+        for name in names:
+            self.unsubscribe(name, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = dict(self._workers)
+        return {
+            "published": self.published,
+            "sinks": {name: worker.stats() for name, worker in workers.items()},
+        }
+
+
+class StubSink(FrameSink):
+    """Sink de prueba: guarda (width, height) de cada frame. Puede simular
+    lentitud (`delay`) y fallas (`fail_every`)"""
+
+    name = "stub"
+
+    def __init__(self, name: str = "stub", delay: float = 0.0, fail_every: int = 0, keep: int = 100):
+        self.name = name
+        self.delay = delay
+        self.fail_every = fail_every
+        self.keep = keep
+        self.frames: List[Tuple[int, int]] = []
+        self.calls = 0
+        self.resets = 0
+        self.closed = False
+
+    def send(self, frame: Frame, params: Any):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise RuntimeError("stub failure")
+        self.frames.append(frame.size)
+        del self.frames[:-self.keep]
+
+    def reset(self):
+        self.resets += 1
+
+    def close(self):
+        self.closed = True
+
+
+class RecorderSink(FrameSink):
+    """Graba la salida a un archivo MJPEG (JPEGs concatenados, lo lee ffmpeg
+    con `-f mjpeg`). La codificación corre en el hilo del sink"""
+
+    name = "recorder"
+
+    def __init__(self, path: str, quality: int = 90):
+        self.path = path
+        self.quality = quality
+        self._file = None
+        self.frames = 0
+
+    def open(self):
+        self._file = open(self.path, "ab")
+
+    def send(self, frame: Frame, params: Any):
+        if self._file is None:
+            self.open()
+        frame.to_pil().save(self._file, format="JPEG", quality=self.quality)
+        self.frames += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,158 @@
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    import torch
+except Exception:
+    torch = None  # type: ignore
+
+
+class Frame:
+    """Imagen RGB que recorre decode → preprocess → infer → blend → sinks → encode.
+
+    Guarda un array uint8 (H, W, 3) en CPU y/o un tensor torch (3, H, W) en
+    [0, 1] (p.ej. la salida de StreamDiffusion con output_type="pt"). Cada
+    representación se calcula una sola vez y queda cacheada; PIL solo aparece
+    en los bordes que lo necesitan (to_pil).
+    """
+
+    __slots__ = ("_array", "_tensor")
+
+    def __init__(self, array: Optional[np.ndarray] = None, tensor=None):
+        if array is None and tensor is None:
+            raise ValueError("Frame needs an array or a tensor")
+        self._array = array
+        self._tensor = tensor
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "Frame":
+        return cls(array=array)
+
+    @classmethod
+    def from_tensor(cls, tensor) -> "Frame":
+        if tensor.dim() == 4:
+            tensor = tensor[0]
+        return cls(tensor=tensor)
+
+    @classmethod
+    def from_pil(cls, image: Image.Image) -> "Frame":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return cls(array=np.asarray(image))
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), como PIL"""
+        if self._array is not None:
+            return self._array.shape[1], self._array.shape[0]
+        return self._tensor.shape[2], self._tensor.shape[1]
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def tensor(self):
+        """Tensor original, si el frame vino de torch (sin conversión)"""
+        return self._tensor
+
+    def to_array(self) -> np.ndarray:
+        """Array uint8 (H, W, 3) contiguo. Si viene de un tensor la cuantización
+        se hace en el device y se copia a CPU una sola vez"""
+        if self._array is None:
+            t = self._tensor
+            if t.is_floating_point():
+                t = t.mul(255).round_().clamp_(0, 255)
+            self._array = t.to(torch.uint8).permute(1, 2, 0).contiguous().cpu().numpy()
+        return self._array
+
+    def to_tensor(self, device=None, dtype=None):
+        """Tensor (3, H, W) en [0, 1]"""
+        if self._tensor is None:
+            # Una sola copia, directo al device (el array puede ser de solo lectura)
+            t = torch.tensor(self._array, device=device)
+            self._tensor = t.permute(2, 0, 1).to(dtype or torch.float32).div_(255)
+        t = self._tensor
+        if device is not None or dtype is not None:
+            t = t.to(device=device, dtype=dtype)
+        return t
+
+    def to_pil(self) -> Image.Image:
+        return Image.fromarray(self.to_array())
+
+    def resized(self, width: int, height: int) -> "Frame":
+        """Copia a otra resolución (bilineal); si viene de un tensor, en su device"""
+        if self.size == (width, height):
+            return self
+        if self._tensor is not None:
+            t = self._tensor
+            dtype = t.dtype
+            t = torch.nn.functional.interpolate(
+                t[None].float(), size=(height, width), mode="bilinear", align_corners=False
+            )[0]
+            return Frame.from_tensor(t.to(dtype) if dtype.is_floating_point else t.round().clamp(0, 255).to(dtype))
+        return Frame.from_pil(self.to_pil().resize((width, height), Image.BILINEAR))
+
+
+# Un píxel RGB de 3 bytes dentro de uno RGBA de 4: copiar con este dtype
+# mueve cada píxel de una vez en vez de tres bytes sueltos
+_RGB_IN_RGBA = np.dtype({"names": ["rgb"], "formats": ["V3"], "offsets": [0], "itemsize": 4})
+
+
+class RGBAConverter:
+    """RGB → RGBA/BGRA uint8 en un buffer preasignado (salida Spout).
+
+    El buffer se reserva una vez por resolución con el alpha ya en 255; cada
+    conversión es una sola pasada vectorizada que escribe los tres canales
+    de color. El array devuelto se reutiliza: hay que consumirlo antes de la
+    próxima llamada.
+    """
+
+    def __init__(self, order: str = "RGBA"):
+        if order not in ("RGBA", "BGRA"):
+            raise ValueError(f"Unsupported channel order: {order}")
+        self.order = order
+        self.allocations = 0
+        self._buffer: Optional[np.ndarray] = None
+        self._rgb: Optional[np.ndarray] = None
+
+    def _ensure(self, height: int, width: int) -> np.ndarray:
+        if self._buffer is None or self._buffer.shape[:2] != (height, width):
+            self._buffer = np.empty((height, width, 4), dtype=np.uint8)
+            self._buffer[..., 3] = 255
+            self._rgb = self._buffer.view(_RGB_IN_RGBA).reshape(height, width)["rgb"]
+            self.allocations += 1
+        return self._buffer
+
+    def convert(self, source) -> np.ndarray:
+        """`source`: Frame, array uint8 (H, W, 3) o tensor (3, H, W) en [0, 1]"""
+        if isinstance(source, Frame):
+            source = source.to_array()
+        if torch is not None and isinstance(source, torch.Tensor):
+            return self._from_tensor(source)
+        height, width = source.shape[:2]
+        buffer = self._ensure(height, width)
+        if self.order == "RGBA" and source.dtype == np.uint8 and source.flags.c_contiguous:
+            np.copyto(self._rgb, source.view("V3").reshape(height, width))
+        else:
+            buffer[..., :3] = source if self.order == "RGBA" else source[..., ::-1]
+        return buffer
+
+    def _from_tensor(self, tensor) -> np.ndarray:
+        if tensor.dim() == 4:
+            tensor = tensor[0]
+        if tensor.is_floating_point():
+            tensor = tensor.mul(255).round_().clamp_(0, 255)
+        tensor = tensor.to(torch.uint8)
+        if self.order == "BGRA":
+            tensor = tensor.flip(0)
+        buffer = self._ensure(tensor.shape[1], tensor.shape[2])
+        # Cuantización y swizzle en el device; una sola copia al buffer
+        torch.from_numpy(buffer)[..., :3].copy_(tensor.permute(1, 2, 0))
+        return buffer
@@ -1,6 +1,7 @@
 import sys
 import os
 import platform
+import time
 
 sys.path.append(
     os.path.join(
@@ -30,6 +31,17 @@ import torch
 import numpy as np
 
 from config import Args
+from blending import FrameBlender
+from frame_bus import FrameBus, FrameSink, RecorderSink
+from shm_sink import ShmSink
+from frames import Frame, RGBAConverter
+from latent_slots import SessionLatents
+from engines import EngineManifest, bucket_dir, entry_key, frame_buffer_sizes
+from metrics import timed
+from pipeline_pool import PipelinePool, parse_buckets, resolution_buckets
+from prompt_bank import PromptBank
+from prompt_cache import PROMPT_CACHE
+from schedule_cache import ScheduleCache, schedule_key
 from pydantic import BaseModel, Field
 from PIL import Image
 from typing import Optional, List, Dict, Any
@@ -47,6 +59,68 @@ class StepsConfig:
         t2 = int((self._base_t2 * self.total_steps) / self._base_total)
         return [t1, t2]
 
+class SpoutSink(FrameSink):
+    """Salida Spout (Windows) como sink del FrameBus: crear, reiniciar y
+    enviar al SpoutSender corre en el hilo del sink, no en el de inferencia"""
+
+    name = "spout"
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.spout_sender = None
+        self._sender_size = None
+        # El sender se crea con GL_RGBA: los bytes van en orden R, G, B, A
+        self.converter = RGBAConverter("RGBA")
+
+    def resize(self, width: int, height: int):
+        """Nueva resolución: el sender se recrea en el próximo envío"""
+        self.width = width
+        self.height = height
+
+    def open(self):
+        import time
+        # Crear un nuevo SpoutSender con un nombre único basado en timestamp
+        spout_name = f"LivualsOutput_{int(time.time())}"  # Nombre único para evitar conflictos
+        print(f"Inicializando SpoutSender {spout_name} con resolución {self.width}x{self.height}")
+        self.spout_sender = SpoutSender(spout_name, self.width, self.height, GL_RGBA)
+        self._sender_size = (self.width, self.height)
+
+    def close(self):
+        if self.spout_sender is None:
+            return
+        print("Cerrando SpoutSender...")
+        try:
+            self.spout_sender.release()
+        except Exception as e:
+            print(f"Error al liberar SpoutSender: {e}")
+        finally:
+            self.spout_sender = None
+            self._sender_size = None
+            # Pequeña pausa para asegurar que los recursos se liberen completamente
+            import time
+            time.sleep(0.5)
+
+    def send(self, frame: Frame, params):
+        # Enviar a Spout solo si está habilitado en los params de la sesión
+        if not getattr(params, "enableSpout", True):
+            return
+        if self._sender_size != (self.width, self.height):
+            # Primera vez o la resolución cambió
+            self.close()
+            self.open()
+
+        # Asegurar el tamaño correcto (el array del frame no se modifica)
+        if frame.size != (self.width, self.height):
+            frame = Frame.from_pil(frame.to_pil().resize((self.width, self.height)))
+
+        # Buffer uint8 reutilizado; se reasigna solo si cambia la resolución
+        rgba = self.converter.convert(frame)
+
+        # Enviar a Spout sin flip
+        self.spout_sender.send_image(rgba, False)
+
+
 try:
     from diffusers import AutoPipelineForImage2Image
 except Exception:
@@ -63,6 +137,46 @@ default_negative_prompt = "black and white, blurry, low resolution, pixelated,
 page_content = """"""
 
 
+def build_stream_wrapper(
+    model_id: str,
+    use_tiny_vae: bool,
+    device: torch.device,
+    dtype: torch.dtype,
+    t_index_list: List[int],
+    frame_buffer_size: int,
+    width: int,
+    height: int,
+    acceleration: str,
+    engine_dir: str,
+    safety_checker: bool = False,
+    warmup: int = 10,
+) -> StreamDiffusionWrapper:
+    """StreamDiffusionWrapper img2img; lo usan el servidor y engines.py build.
+    Con TensorRT los engines de cada resolución van a su subdirectorio"""
+    if acceleration == "tensorrt":
+        engine_dir = bucket_dir(engine_dir, width, height)
+    return StreamDiffusionWrapper(
+        model_id_or_path=model_id,
+        use_tiny_vae=use_tiny_vae,
+        device=device,
+        dtype=dtype,
+        t_index_list=t_index_list,
+        frame_buffer_size=frame_buffer_size,
+        width=width,
+        height=height,
+        use_lcm_lora=False,
+        output_type="pt",
+        warmup=warmup,
+        vae_id=None,
+        acceleration=acceleration,
+        mode="img2img",
+        use_denoising_batch=True,
+        cfg_type="none",
+        use_safety_checker=safety_checker,
+        engine_dir=engine_dir,
+    )
+
+
 class Pipeline:
     class Info(BaseModel):
         name: str = "StreamDiffusion img2img"
@@ -111,6 +225,20 @@ class Pipeline:
             field="range",
             id="steps",
         )
+        # Prompt del banco (/api/prompt-bank) en vez del texto: -1 usa `prompt`.
+        # Con prompt_mix_index >= 0 interpola hacia ese prompt (prompt_mix 0..1)
+        prompt_index: int = Field(
+            -1, min=-1, title="Prompt Bank Index", field="range", id="prompt_index",
+            hide=True, disabled=True,
+        )
+        prompt_mix_index: int = Field(
+            -1, min=-1, title="Prompt Bank Mix Target", field="range", id="prompt_mix_index",
+            hide=True, disabled=True,
+        )
+        prompt_mix: float = Field(
+            0.0, min=0.0, max=1.0, title="Prompt Bank Mix", field="range", id="prompt_mix",
+            hide=True, disabled=True,
+        )
 
     def __init__(self, args: Args, device: torch.device, torch_dtype: torch.dtype):
         params = self.InputParams()
@@ -126,51 +254,192 @@ class Pipeline:
         self.transition_progress = 0.0
         self.old_steps_config = None
         self.transition_frames = 10
+        # Mezcla de las transiciones: buffers reutilizados, sin floats por frame
+        self.blender = FrameBlender()
+        # Con --latent-blend: último latente antes de la transición y cuántos
+        # frames del batch en curso ya salieron mezclados del VAE
+        self.last_valid_latent = None
+        self._latent_blended = 0
+        # Latentes del denoising batch de cada sesión (ver latent_slots.py)
+        self.session_latents = SessionLatents()
+        # Última vez que llegó un frame de cada sesión (elige el stream de 1 frame)
+        self._session_seen: Dict[Any, float] = {}
+        # Schedules ya preparados por cantidad de steps (ver schedule_cache.py)
+        self.schedule_cache = ScheduleCache(getattr(self.args, "schedule_cache_size", 64))
+        PROMPT_CACHE.resize(int(getattr(self.args, "prompt_cache_mb", 64) * 1024 * 1024))
+        # Prompts del set precalculados en segundo plano cuando la inferencia está libre
+        self.prompt_bank = PromptBank(self.encode_prompt, is_busy=lambda: self.busy)
         self.current_params = params
+        # Revisión de los últimos params vistos (ver params_cache.ParamsCache)
+        self.params_revision = None
         
         # Configurar dimensiones para Spout y StreamDiffusion
-        self.spout_sender = None
+        self.spout_sink = None
         self.spout_width = params.width
         self.spout_height = params.height
 
+        # Sinks de salida (Spout, grabación, ...) en sus propios hilos
+        self.frame_bus = FrameBus()
+        if getattr(self.args, "record_path", None):
+            self.frame_bus.subscribe(RecorderSink(self.args.record_path))
+        if getattr(self.args, "shm_output", None):
+            self.frame_bus.subscribe(
+                ShmSink(self.args.shm_output, self.args.shm_slots, params.width, params.height)
+            )
+
+        # Engines de TensorRT ya armados (engines.py build), por bucket
+        self.engine_manifest = None
+        if self.device.type == "cuda" and self.args.acceleration == "tensorrt":
+            self.engine_manifest = EngineManifest(self.args.engine_dir)
+            ready = self.ready_buckets()
+            print(f"Engines listos para {len(ready)} resoluciones: {', '.join(f'{w}x{h}' for w, h in ready) or '-'}")
+
+        # Pipelines listos por bucket de resolución (solo StreamDiffusion en CUDA)
+        self.pipeline_pool = None
+        if self.device.type == "cuda":
+            self.pipeline_pool = PipelinePool(
+                self._build_stream,
+                budget_bytes=int(getattr(self.args, "pipeline_pool_mb", 0) * 2**20),
+                memory=lambda: torch.cuda.memory_allocated(self.device),
+            )
+
         # Inicializar StreamDiffusion primero
         self.initstreamdiffusion(params)
         
         # Inicializar Spout solo después de que StreamDiffusion esté activo
         if self.ready:
             self.initspout()
+
+        # Precalentar en segundo plano los buckets configurados. "ready": los
+        # que ya tienen engine; de los pedidos, esos primero (tardan segundos, no minutos)
+        spec = getattr(self.args, "prewarm_buckets", None)
+        ready = self.ready_buckets()
+        if spec and spec.strip().lower() == "ready":
+            buckets = ready
+        else:
+            buckets = parse_buckets(spec, self.resolution_grid())
+            buckets.sort(key=lambda bucket: bucket not in ready)
+        if self.pipeline_pool is not None and buckets:
+            self.pipeline_pool.prewarm(buckets, is_busy=lambda: self.busy)
+
+    @property
+    def steps_cost_time(self) -> bool:
+        """Si bajar los steps ahorra inferencia: solo en el fallback de diffusers.
+        StreamDiffusion corre siempre una pasada del UNet por t_index"""
+        return self.device.type != "cuda"
+
+    def resolution_grid(self) -> List[tuple]:
+        """Buckets posibles según los sliders de width/height"""
+        width = self.InputParams.schema()["properties"]["width"]
+        return resolution_buckets(width["min"], width["max"], width["step"])
+
+    def _engine_batch(self, frame_buffer_size: int) -> int:
+        """Batch del engine del UNet: un latente por t_index y por frame del buffer"""
+        return len(self.steps_config.t_index_list) * frame_buffer_size
+
+    def _engine_key(self, bucket: tuple, frame_buffer_size: int) -> str:
+        return entry_key(
+            base_model, self.args.taesd, bucket[0], bucket[1],
+            self._engine_batch(frame_buffer_size), frame_buffer_size, self.args.acceleration,
+        )
+
+    def ready_buckets(self) -> List[tuple]:
+        """Buckets con los engines en disco según el manifest, para todos
+        sus streams (sin TensorRT, ninguno)"""
+        if self.engine_manifest is None:
+            return []
+        grid = self.resolution_grid()
+        for frame_buffer_size in frame_buffer_sizes(self.args.max_batch_size):
+            available = self.engine_manifest.available(
+                base_model, self.args.taesd, self._engine_batch(frame_buffer_size), frame_buffer_size
+            )
+            grid = [bucket for bucket in grid if bucket in available]
+        return sorted(grid)
+
+    def _index_engines(self, bucket: tuple, frame_buffer_size: int, used: bool = False):
+        """Anota en el manifest el engine del bucket si lo armó el servidor
+        y, con `used`, cuándo se usó por última vez"""
+        if self.engine_manifest is None:
+            return
+        try:
+            key = self._engine_key(bucket, frame_buffer_size)
+            if key not in self.engine_manifest.entries or self.engine_manifest.verify(key):
+                # Sin hash: no vale la pena leer 2 GB en el hilo de inferencia
+                self.engine_manifest.record(
+                    base_model, self.args.taesd, bucket[0], bucket[1], self._engine_batch(frame_buffer_size),
+                    frame_buffer_size, hash_files=False,
+                )
+                if not used:
+                    self.engine_manifest.save()
+            if used:
+                self.engine_manifest.touch(key)
+        except Exception as e:
+            print(f"Manifest de engines: no se pudo anotar {bucket[0]}x{bucket[1]}: {e}")
+
+    def _build_stream(self, bucket: tuple, wait_idle=lambda: None) -> Dict[int, tuple]:
+        """Arma los StreamDiffusionWrapper del bucket (width, height), uno por
+        tamaño de frame buffer ({frames: (stream, schedule_cache)}), con sus
+        schedules ya preparados. Lo usa el pool, también desde el hilo de
+        prewarm: ahí `wait_idle` espera entre etapas a que no haya un frame en curso"""
+        return {
+            frame_buffer_size: self._build_stream_frames(bucket, frame_buffer_size, wait_idle)
+            for frame_buffer_size in frame_buffer_sizes(self.args.max_batch_size)
+        }
+
+    def _build_stream_frames(self, bucket: tuple, frame_buffer_size: int, wait_idle=lambda: None):
+        width, height = bucket
+        print(f"Construyendo StreamDiffusion {width}x{height} ({frame_buffer_size} frames por llamada)...")
+        stream = build_stream_wrapper(
+            base_model,
+            self.args.taesd,
+            self.device,
+            self.torch_dtype,
+            self.steps_config.t_index_list,
+            frame_buffer_size,
+            width,
+            height,
+            self.args.acceleration,
+            self.args.engine_dir,
+            safety_checker=self.args.safety_checker,
+            # El warmup va aparte (_warmup_stream), de a una pasada
+            warmup=0,
+        )
+        self._index_engines(bucket, frame_buffer_size)
+        # Los schedules dependen de la resolución y el batch: un cache por stream
+        schedule_cache = ScheduleCache(getattr(self.args, "schedule_cache_size", 64))
+        self.prewarm_schedules(default_prompt, stream, schedule_cache, wait_idle)
+        wait_idle()
+        self.apply_schedule(default_prompt, stream=stream, cache=schedule_cache)
+        self._warmup_stream(stream, wait_idle)
+        return stream, schedule_cache
+
+    def _warmup_stream(self, stream, wait_idle=lambda: None, iterations: int = 10):
+        """Pasadas en vacío (autotuning de kernels, allocator) antes del primer frame real"""
+        inner = stream.stream
+        dummy = torch.zeros(
+            (inner.frame_bff_size, 3, inner.height, inner.width), device=self.device, dtype=self.torch_dtype
+        )
+        for _ in range(iterations):
+            wait_idle()
+            inner(dummy)
+        torch.cuda.synchronize(self.device)
         
     def initstreamdiffusion(self, params):
         """Inicializa o reinicializa StreamDiffusion con los parámetros actuales"""
         if self.device.type == "cuda":
-            # Usar StreamDiffusion solo en CUDA para evitar dependencias CUDA en CPU/MPS
-            self.stream = StreamDiffusionWrapper(
-                model_id_or_path=base_model,
-                use_tiny_vae=self.args.taesd,
-                device=self.device,
-                dtype=self.torch_dtype,
-                t_index_list=self.steps_config.t_index_list,
-                frame_buffer_size=1,
-                width=params.width,
-                height=params.height,
-                use_lcm_lora=False,
-                output_type="pil",
-                warmup=10,
-                vae_id=None,
-                acceleration=self.args.acceleration,
-                mode="img2img",
-                use_denoising_batch=True,
-                cfg_type="none",
-                use_safety_checker=self.args.safety_checker,
-                engine_dir=self.args.engine_dir,
-            )
-            self.last_prompt = default_prompt
-            self.stream.prepare(
-                prompt=default_prompt,
-                negative_prompt=default_negative_prompt,
-                num_inference_steps=self.steps_config.total_steps,
-                guidance_scale=1.2,
-            )
+            # Usar StreamDiffusion solo en CUDA para evitar dependencias CUDA en CPU/MPS.
+            # Del pool si el bucket ya está armado; si no se construye ahora
+            self.streams = self.pipeline_pool.acquire((params.width, params.height))
+            # Arranca con el de más frames; _infer_batch pasa al de 1 con una sola sesión
+            self.stream, self.schedule_cache = self.streams[max(self.streams)]
+            for frame_buffer_size in self.streams:
+                self._index_engines((params.width, params.height), frame_buffer_size, used=True)
+            # El pool pudo desalojar el stream anterior
+            torch.cuda.empty_cache()
+            self.apply_schedule(default_prompt)
+            # El conditioning del stream puede ser de otra sesión: re-aplicarlo en el próximo frame
+            self.last_prompt = None
+            self.session_latents.reset()
             self.ready = True
         else:
             # Fallback Diffusers para CPU/MPS
@@ -201,13 +470,20 @@ class Pipeline:
         if resolucion_cambiada:
             print(f"Resolución cambiada de {old_width}x{old_height} a {self.spout_width}x{self.spout_height}")
             
-            # Cerrar completamente Spout antes de reinicializarlo
-            self.close_spout()
+            # Spout no se cierra acá: initspout le pasa la nueva resolución al
+            # sink, que libera y recrea el SpoutSender en su propio hilo
             
             # Reinicializar StreamDiffusion primero con las nuevas dimensiones
             if hasattr(self, 'stream'):
                 print("Reinicializando StreamDiffusion con nueva resolución...")
+                previous = self.last_valid_image
                 self.initstreamdiffusion(params)
+
+                # Crossfade desde el último frame del bucket anterior, escalado
+                if previous is not None and self.ready:
+                    self.last_valid_image = previous.resized(params.width, params.height)
+                    self.in_transition = True
+                    self.transition_progress = 0.0
                 
                 # Reinicializar Spout solo si StreamDiffusion está activo
                 if self.ready:
@@ -219,32 +495,11 @@ class Pipeline:
         return resolucion_cambiada
         
     def close_spout(self):
-        """Cierra completamente el SpoutSender y libera recursos"""
-        if not SPOUT_AVAILABLE:
-            return
-            
-        if self.spout_sender is not None:
-            print("Cerrando SpoutSender...")
-            try:
-                # Intentar liberar el SpoutSender
-                self.spout_sender.release()
-                print("SpoutSender liberado correctamente")
-            except Exception as e:
-                print(f"Error al liberar SpoutSender: {e}")
-            finally:
-                # Asegurarse de que el SpoutSender se establezca a None
-                self.spout_sender = None
-                
-                # Resetear las dimensiones actuales
-                if hasattr(self, 'spout_width_current'):
-                    delattr(self, 'spout_width_current')
-                if hasattr(self, 'spout_height_current'):
-                    delattr(self, 'spout_height_current')
-                    
-                # Pequeña pausa para asegurar que los recursos se liberen completamente
-                import time
-                time.sleep(0.5)
-                
+        """Quita el sink de Spout del bus; el SpoutSender se libera en el hilo del sink"""
+        if self.spout_sink is not None:
+            self.frame_bus.unsubscribe(SpoutSink.name)
+            self.spout_sink = None
+
     def release_resources(self):
         """Libera completamente los recursos de StreamDiffusion y Spout"""
         print("Liberando recursos de StreamDiffusion y Spout...")
@@ -256,7 +511,10 @@ class Pipeline:
         if hasattr(self, 'stream'):
             try:
                 print("Liberando recursos de StreamDiffusion...")
-                # Liberar el modelo y limpiar la memoria CUDA
+                # Liberar el modelo (y los del pool) y limpiar la memoria CUDA
+                if self.pipeline_pool is not None:
+                    self.pipeline_pool.clear()
+                self.streams = {}
                 del self.stream
                 if self.device.type == "cuda":
                     torch.cuda.empty_cache()
@@ -269,6 +527,7 @@ class Pipeline:
         
         # Liberar otros recursos
         self.last_valid_image = None
+        self.last_valid_latent = None
         self.ready = False
         
         # Pequeña pausa para asegurar que los recursos se liberen completamente
@@ -301,153 +560,296 @@ class Pipeline:
             print("No hay parámetros disponibles para reinicializar")
 
     def initspout(self):
-        """Inicializa el emisor Spout con las dimensiones actuales
-        Si ya existe un SpoutSender, verifica si la resolución cambió.
-        Si cambió, libera el anterior y crea uno nuevo.
+        """Suscribe la salida Spout al bus con las dimensiones actuales.
+        Si ya existe, solo le avisa la nueva resolución: el sink recrea el
+        SpoutSender en su hilo.
         """
         if not SPOUT_AVAILABLE:
             return
-            
-        try:
-            # Verificar si ya existe un SpoutSender y si la resolución cambió
-            if self.spout_sender is not None:
-                # Si la resolución es la misma, mantener el SpoutSender existente
-                if hasattr(self, 'spout_width_current') and hasattr(self, 'spout_height_current') and \
-                   self.spout_width == self.spout_width_current and self.spout_height == self.spout_height_current:
-                    print(f"Manteniendo SpoutSender existente con resolución {self.spout_width}x{self.spout_height}")
-                    return
-                    
-                # Si la resolución cambió, liberar el SpoutSender existente
-                print(f"Resolución cambiada de {getattr(self, 'spout_width_current', 'N/A')}x{getattr(self, 'spout_height_current', 'N/A')} a {self.spout_width}x{self.spout_height}")
-                print("Liberando SpoutSender anterior...")
-                
-                try:
-                    # Intentar liberar el SpoutSender con manejo de excepciones
-                    self.spout_sender.release()
-                except Exception as e:
-                    print(f"Error al liberar SpoutSender: {e}")
-                finally:
-                    # Asegurarse de que el SpoutSender se establezca a None
-                    self.spout_sender = None
-                    
-                # Pequeña pausa para asegurar que los recursos se liberen completamente
-                import time
-                time.sleep(0.5)
-            
-            # Inicializar Spout con las dimensiones actuales
-            print(f"Inicializando SpoutSender con resolución {self.spout_width}x{self.spout_height}")
-            
-            # Crear un nuevo SpoutSender con un nombre único basado en timestamp
-            import time
-            spout_name = f"LivualsOutput_{int(time.time())}"  # Nombre único para evitar conflictos
-            self.spout_sender = SpoutSender(spout_name, self.spout_width, self.spout_height, GL_RGBA)
-            print(f"Nuevo SpoutSender creado con nombre: {spout_name}")
-            
-            # Guardar la resolución actual para futuras comparaciones
-            self.spout_width_current = self.spout_width
-            self.spout_height_current = self.spout_height
-            
-        except Exception as e:
-            print(f"Warning: Could not initialize Spout: {e}")
-            self.spout_sender = None
-    
-    def sendSpout(self, image):
-        """Enviar imagen a Spout"""
-        # Si no estamos en Windows, Spout no está disponible, StreamDiffusion no está activo o Spout no está inicializado, no hacer nada
-        if not SPOUT_AVAILABLE or self.spout_sender is None or not self.ready:
-            if not self.ready and SPOUT_AVAILABLE and self.spout_sender is not None:
-                print("StreamDiffusion no está activo, omitiendo envío a Spout")
-            return
-            
-        if not isinstance(image, Image.Image):
+        if self.spout_sink is None:
+            self.spout_sink = self.frame_bus.subscribe(
+                SpoutSink(self.spout_width, self.spout_height)
+            )
+        else:
+            self.spout_sink.resize(self.spout_width, self.spout_height)
+
+    def apply_schedule(
+        self,
+        prompt: str,
+        steps_config: Optional[StepsConfig] = None,
+        stream=None,
+        cache: Optional[ScheduleCache] = None,
+    ) -> bool:
+        """Deja el stream (por defecto el activo) con el schedule de
+        `steps_config` (por defecto el actual): del cache si ya se preparó,
+        si no con `prepare`"""
+        steps_config = steps_config or self.steps_config
+        t_index_list = steps_config.t_index_list
+        wrapper = stream or self.stream
+        cache = cache or self.schedule_cache
+        # t_list vive en el StreamDiffusion interno, no en el wrapper
+        inner = wrapper.stream
+
+        def prepare():
+            inner.t_list = t_index_list
+            inner.denoising_steps_num = len(t_index_list)
+            wrapper.prepare(
+                prompt=prompt,
+                negative_prompt=default_negative_prompt,
+                num_inference_steps=steps_config.total_steps,
+                guidance_scale=1.2,
+            )
+            # prepare codificó el prompt y dejó sus embeddings en el stream
+            if wrapper is getattr(self, "stream", None):
+                self.last_prompt = (prompt,)
+
+        key = schedule_key(steps_config.total_steps, t_index_list)
+        return cache.apply(key, inner, prepare)
+
+    def prewarm_schedules(
+        self, prompt: str, stream=None, cache: Optional[ScheduleCache] = None, wait_idle=lambda: None
+    ):
+        """Prepara de antemano todos los valores del slider de steps si entran en el cache"""
+        cache = cache or self.schedule_cache
+        field = self.InputParams.schema()["properties"]["steps"]
+        steps_range = range(field.get("min", 1), field.get("max", 50) + 1)
+        if len(steps_range) > cache.max_entries:
             return
-            
-        # Hacer una copia para Spout para no modificar la original
-        spout_image = image.copy()
-        
-        # Asegurar el tamaño correcto
-        if spout_image.size != (self.spout_width, self.spout_height):
-            spout_image = spout_image.resize((self.spout_width, self.spout_height))
-        
-        # Convertir a array numpy
-        img_array = np.array(spout_image)
-        
-        # Crear array BGRA
-        bgra = np.zeros((self.spout_height, self.spout_width, 4), dtype=np.int32)
-        
-        # Reordenar canales RGB -> BGR y asignar alpha
-        bgra[..., 2] = img_array[..., 2]  # B
-        bgra[..., 1] = img_array[..., 1]  # G
-        bgra[..., 0] = img_array[..., 0]  # R
-        bgra[..., 3] = 255              # Alpha opaco
-        
-        # Enviar a Spout sin flip
-        self.spout_sender.send_image(bgra, False)
-        
+        start = time.time()
+        for steps in steps_range:
+            wait_idle()
+            self.apply_schedule(prompt, StepsConfig(steps), stream, cache)
+        print(f"Schedules de {steps_range.start} a {steps_range.stop - 1} steps preparados en {time.time() - start:.2f}s")
+
     def blend_frames(self, frame1, frame2, alpha):
         """Blend two frames using alpha blending"""
         try:
-            # Convert to numpy arrays first
-            if isinstance(frame1, Image.Image):
-                frame1 = np.array(frame1)
-            if isinstance(frame2, Image.Image):
-                frame2 = np.array(frame2)
-            
-            # Ensure both are float32 for blending
-            frame1 = frame1.astype(np.float32)
-            frame2 = frame2.astype(np.float32)
-            
-            # Do the blend in numpy
-            blended = frame1 * (1 - alpha) + frame2 * alpha
-            blended = np.clip(blended, 0, 255).astype(np.uint8)
-            
-            return Image.fromarray(blended)
+            # En el device si ambos son tensores, si no en punto fijo uint8
+            return self.blender.blend(frame1, frame2, alpha)
         except Exception as e:
             print(f"Blend error: {e}")
             return frame2 if alpha > 0.5 else frame1
 
-    def predict(self, params: "Pipeline.InputParams") -> Image.Image:
+    def batch_key(self, params) -> tuple:
+        """Frames con la misma clave pueden procesarse en una sola llamada batch.
+        StreamDiffusion comparte prompt y schedule entre todo el batch."""
+        return (params.width, params.height, params.steps) + self.conditioning(params)[0]
+
+    def _prepare_input_tensor(self, image) -> torch.Tensor:
+        if isinstance(image, Frame):
+            image = image.to_array()
+        if isinstance(image, np.ndarray):
+            # Frame ya decodificado a la resolución destino (util.decode_frame):
+            # mismo resultado que preprocess_image, sin pasar por PIL
+            image_tensor = torch.tensor(image, device=self.device).permute(2, 0, 1).unsqueeze(0)
+            image_tensor = image_tensor.to(self.torch_dtype).div_(127.5).sub_(1.0)
+        else:
+            image_tensor = self.stream.preprocess_image(image)
+        if isinstance(image_tensor, torch.Tensor):
+            # Ajustar brillo en el tensor de entrada
+            image_tensor = torch.clamp(image_tensor * 1.8, 0, 1)
+            image_tensor *=2.+.2;
+        return image_tensor
+
+    def _run_stream(self, image_tensor: torch.Tensor, params) -> torch.Tensor:
+        """Corre StreamDiffusion y devuelve (N, 3, H, W) en [0, 1].
+        Sin safety checker la salida no sale del device ni pasa por PIL"""
+        self._set_stream_conditioning(params)
+        if self.args.safety_checker:
+            # El wrapper aplica el safety checker (con output_type="pt" devuelve en CPU)
+            output = self.stream(image=image_tensor)
+            if isinstance(output, (Image.Image, list)):
+                # Fallback NSFW del wrapper: imagen PIL (negra, 512x512) aunque output_type sea "pt"
+                output = self._pil_to_tensor(output)
+            return output if output.dim() == 4 else output.unsqueeze(0)
+        if self.args.latent_blend:
+            output = self._run_stream_latent(image_tensor)
+        else:
+            output = self.stream.stream(image_tensor)
+        return (output / 2 + 0.5).clamp_(0, 1)
+
+    def _pil_to_tensor(self, images) -> torch.Tensor:
+        """PIL (o lista de PIL) → (N, 3, H, W) en [0, 1] al tamaño del stream"""
+        stream = self.stream.stream
+        return torch.stack([
+            Frame.from_pil(image).resized(stream.width, stream.height).to_tensor()
+            for image in (images if isinstance(images, list) else [images])
+        ])
+
+    def encode_prompt(self, prompt: str) -> torch.Tensor:
+        """Embedding (1, 77, D) del prompt, del cache compartido del proceso"""
+        pipe = self.stream.stream.pipe if hasattr(self, "stream") else self._diffusers_pipe
+
+        def encode(text: str) -> torch.Tensor:
+            with torch.no_grad(), timed("prompt"):
+                return pipe.encode_prompt(
+                    prompt=text,
+                    device=self.device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=False,
+                )[0]
+
+        return PROMPT_CACHE.get_or_encode(base_model, prompt, encode)
+
+    def conditioning(self, params) -> tuple:
+        """(clave, función que devuelve el embedding) del conditioning de
+        `params`: un prompt del banco (o la mezcla de dos) o el texto"""
+        index = getattr(params, "prompt_index", -1)
+        if self.prompt_bank.valid(index):
+            other = getattr(params, "prompt_mix_index", -1)
+            if not self.prompt_bank.valid(other):
+                # Mezcla hacia un índice que no existe: solo el prompt `index`
+                other = -1
+            t = round(float(getattr(params, "prompt_mix", 0.0)), 4)
+            key = ("bank", self.prompt_bank.generation, index, other, t)
+            return key, lambda: self.prompt_bank.mix(index, other, t)
+        return (params.prompt,), lambda: self.encode_prompt(params.prompt)
+
+    def _set_stream_conditioning(self, params):
+        """Como StreamDiffusion.update_prompt pero sin correr el encoder de
+        texto en cada frame: solo cuando cambia el conditioning, y desde el
+        cache o el banco de prompts"""
+        stream = self.stream.stream
+        key, embedding = self.conditioning(params)
+        embeds = getattr(stream, "prompt_embeds", None)
+        if key == self.last_prompt and embeds is not None and embeds.shape[0] == stream.batch_size:
+            return
+        stream.prompt_embeds = embedding().repeat(stream.batch_size, 1, 1)
+        self.last_prompt = key
+
+    def _run_stream_latent(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        """Los pasos de StreamDiffusion.__call__ por separado, para mezclar
+        en el espacio latente (antes del decode) durante una transición"""
+        stream = self.stream.stream
+        x = stream.image_processor.preprocess(image_tensor, stream.height, stream.width).to(
+            device=stream.device, dtype=stream.dtype
+        )
+        latents = stream.predict_x0_batch(stream.encode_image(x))
+        old = self.last_valid_latent
+        if self.in_transition and old is not None and old.shape[1:] == latents.shape[1:]:
+            with timed("blend"):
+                alphas = [
+                    min(1.0, (self.transition_progress + self._latent_blended + i) / self.transition_frames)
+                    for i in range(latents.shape[0])
+                ]
+                latents = self.blender.blend_latents(old, latents, alphas)
+            self._latent_blended += latents.shape[0]
+        elif not self.in_transition:
+            if old is None or old.shape[1:] != latents.shape[1:]:
+                old = self.last_valid_latent = torch.empty_like(latents[-1:])
+            old.copy_(latents[-1:])
+        output = stream.decode_image(latents).detach().clone()
+        stream.prev_image_result = output
+        return output
+
+    def _infer_batch(self, params_list: List[Any]) -> List[Frame]:
+        """Corre la inferencia de uno o más frames que comparten batch_key"""
+        params = params_list[0]
+        if hasattr(self, "stream") and self.device.type == "cuda":
+            solo = self._active_sessions(params_list) == 1 and len(params_list) == 1
+            self._use_frame_buffer(min(self.streams) if solo else max(self.streams))
+            frame_buffer_size = self.stream.frame_buffer_size
+            outputs = []
+            for start in range(0, len(params_list), frame_buffer_size):
+                chunk = params_list[start:start + frame_buffer_size]
+                with timed("preprocess"):
+                    tensors = [self._prepare_input_tensor(p.image) for p in chunk]
+                    # StreamDiffusion exige exactamente frame_buffer_size imágenes: rellenar repitiendo la última
+                    tensors += [tensors[-1]] * (frame_buffer_size - len(tensors))
+                    image_tensor = tensors[0] if frame_buffer_size == 1 else torch.cat(tensors)
+                # Cada slot sigue con los latentes de su propia sesión; los de relleno arrancan en cero
+                owners = [getattr(p, "session", None) for p in chunk]
+                self.session_latents.route(self.stream.stream, owners + [None] * (frame_buffer_size - len(chunk)))
+                with timed("denoise"):
+                    output = self._run_stream(image_tensor, params)
+                    # Los kernels son asíncronos: sin sincronizar se mediría solo el lanzamiento.
+                    # La cuantización posterior (Frame.to_array) esperaría igual.
+                    torch.cuda.synchronize(self.device)
+                outputs.extend(Frame.from_tensor(t) for t in output[:len(chunk)])
+            return outputs
+
+        assert self._diffusers_pipe is not None
+        images = []
+        with timed("preprocess"):
+            for p in params_list:
+                img = p.image
+                if isinstance(img, Frame):
+                    img = img.to_pil()
+                elif isinstance(img, np.ndarray):
+                    img = Image.fromarray(img)
+                if img.width != p.width or img.height != p.height:
+                    img = img.resize((p.width, p.height), Image.BICUBIC)
+                images.append(img)
+        # Embeddings cacheados: el pipeline no vuelve a correr el encoder de texto
+        prompt_embeds = torch.cat([self.conditioning(p)[1]() for p in params_list])
+        negative_embeds = self.encode_prompt("").expand_as(prompt_embeds)
+        with timed("denoise"):
+            images = self._diffusers_pipe(
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_embeds,
+                image=images,
+                num_inference_steps=int(params.steps),
+                guidance_scale=1.2,
+            ).images
+        return [Frame.from_pil(image) for image in images]
+
+    def _active_sessions(self, params_list: List[Any]) -> int:
+        """Sesiones que mandaron frames en el último segundo, contando las de este batch"""
+        now = time.monotonic()
+        for p in params_list:
+            self._session_seen[getattr(p, "session", None)] = now
+        self._session_seen = {s: t for s, t in self._session_seen.items() if now - t < 1.0}
+        return len(self._session_seen)
+
+    def _use_frame_buffer(self, frame_buffer_size: int):
+        """Pasa al stream del bucket con `frame_buffer_size` frames por llamada"""
+        if self.stream.frame_buffer_size == frame_buffer_size or frame_buffer_size not in self.streams:
+            return
+        # Los latentes de cada sesión siguen en el otro stream
+        self.session_latents.release(self.stream.stream)
+        self.stream, self.schedule_cache = self.streams[frame_buffer_size]
+        # Puede haber quedado con otro schedule (cambio de steps mientras no se usaba)
+        self.apply_schedule(default_prompt)
+        self.last_prompt = None
+
+    def forget_session(self, session):
+        """La sesión se desconectó: descartar sus latentes (desde cualquier hilo)"""
+        self.session_latents.forget(session)
+
+    def predict(self, params: "Pipeline.InputParams") -> Frame:
+        return self.predict_batch([params])[0]
+
+    def predict_batch(self, params_list: List["Pipeline.InputParams"]) -> List[Frame]:
+        """Procesa varios frames (de una o más sesiones) con la misma batch_key"""
         self.busy = True
         try:
-            current_output = None
-            
+            params = params_list[0]
+
             # Verificar si necesitamos reiniciar los recursos (después de un stop)
             if not self.ready and not hasattr(self, "stream"):
                 print("La aplicación fue detenida previamente, intentando reiniciar recursos...")
                 self.restart_resources()
                 
-            # Verificar si la resolución o los parámetros han cambiado
+            # Verificar si la resolución o los parámetros han cambiado.
+            # Los params cacheados traen una revisión: si es la misma no cambió nada.
             resolucion_cambiada = False
-            if hasattr(self, 'current_params'):
-                if (self.current_params.width != params.width or 
-                    self.current_params.height != params.height):
-                    # La resolución cambió, reiniciar StreamDiffusion y Spout
-                    resolucion_cambiada = self.reiniciar_streamdiffusion(params)
-                elif self.current_params.steps != params.steps:
-                    # Solo actualizamos los parámetros actuales
+            revision = getattr(params, "revision", None)
+            if revision is None or revision != self.params_revision:
+                self.params_revision = revision
+                if hasattr(self, 'current_params'):
+                    if (self.current_params.width != params.width or 
+                        self.current_params.height != params.height):
+                        # La resolución cambió, reiniciar StreamDiffusion y Spout
+                        resolucion_cambiada = self.reiniciar_streamdiffusion(params)
+                    elif self.current_params.steps != params.steps:
+                        # Solo actualizamos los parámetros actuales
+                        self.current_params = params
+                else:
                     self.current_params = params
-            else:
-                self.current_params = params
             
             # Normal processing first
-            if hasattr(self, "stream") and self.device.type == "cuda":
-                image_tensor = self.stream.preprocess_image(params.image)
-                if isinstance(image_tensor, torch.Tensor):
-                    # Ajustar brillo en el tensor de entrada
-                    image_tensor = torch.clamp(image_tensor * 1.8, 0, 1)
-                    image_tensor *=2.+.2;
-                current_output = self.stream(image=image_tensor, prompt=params.prompt)
-            else:
-                assert self._diffusers_pipe is not None
-                img = params.image
-                if img.width != params.width or img.height != params.height:
-                    img = img.resize((params.width, params.height), Image.BICUBIC)
-                current_output = self._diffusers_pipe(
-                    prompt=params.prompt,
-                    image=img,
-                    num_inference_steps=int(params.steps),
-                    guidance_scale=1.2,
-                ).images[0]
+            self._latent_blended = 0
+            outputs = self._infer_batch(params_list)
 
             # Check if steps changed
             if params.steps != self.steps_config.total_steps:
@@ -458,58 +860,42 @@ class Pipeline:
                     self.steps_config = StepsConfig(params.steps)
                     
                     if hasattr(self, "stream"):
-                        self.stream.t_list = self.steps_config.t_index_list
-                        self.stream.denoising_steps_num = len(self.steps_config.t_index_list)
-                        self.stream.prepare(
-                            prompt=params.prompt,
-                            negative_prompt=default_negative_prompt,
-                            num_inference_steps=self.steps_config.total_steps,
-                            guidance_scale=1.2
-                        )
-
-            # Handle transition if active
-            if self.in_transition and self.last_valid_image is not None:
-                alpha = self.transition_progress / self.transition_frames
-                output_image = self.blend_frames(self.last_valid_image, current_output, alpha)
-                
-                self.transition_progress += 1
-                if self.transition_progress >= self.transition_frames:
-                    self.in_transition = False
-                    self.transition_progress = 0.0
-                    self.last_valid_image = current_output
-                    return current_output
-                
-                return output_image
-            
-            # Store last valid image and send to Spout if available
-            self.last_valid_image = current_output
-            
-            # Enviar a Spout si está disponible, estamos en Windows y está habilitado
-            if SPOUT_AVAILABLE and getattr(params, 'enableSpout', True):
-                try:
-                    # Verificar si el SpoutSender es None o si ha ocurrido un error previo
-                    if self.spout_sender is None and self.ready:
-                        print("SpoutSender no está inicializado, intentando reinicializar...")
-                        self.initspout()
-                        
-                    # Intentar enviar la imagen a través de Spout
-                    if self.spout_sender is not None:
-                        self.sendSpout(current_output)
-                    else:
-                        print("No se pudo reinicializar SpoutSender, omitiendo envío a Spout")
-                        
-                except Exception as e:
-                    print(f"Warning: Failed to send to Spout: {e}")
-                    # Si hay un error al enviar, intentar reinicializar Spout
-                    print("Intentando reinicializar Spout después del error...")
-                    try:
-                        self.close_spout()
-                        self.initspout()
-                    except Exception as reinit_error:
-                        print(f"Error al reinicializar Spout: {reinit_error}")
-                        self.spout_sender = None
-            
-            return current_output
-            
+                        self.apply_schedule(params.prompt)
+
+            return [self._finish_frame(p, out) for p, out in zip(params_list, outputs)]
+
         finally:
             self.busy = False
+
+    def _finish_frame(self, params, current_output: Frame) -> Frame:
+        """Transición entre steps y publicación en el bus (Spout, grabación, ...)"""
+        output = self._transition_frame(current_output)
+        # No bloquea: cada sink lo procesa en su hilo
+        self.frame_bus.publish(output, params)
+        return output
+
+    def _transition_frame(self, current_output: Frame) -> Frame:
+        # Handle transition if active
+        if self.in_transition and self.last_valid_image is not None:
+            alpha = self.transition_progress / self.transition_frames
+            if self._latent_blended:
+                # Ya salió mezclado del VAE (--latent-blend)
+                self._latent_blended -= 1
+                output_image = current_output
+            else:
+                with timed("blend"):
+                    output_image = self.blend_frames(self.last_valid_image, current_output, alpha)
+            
+            self.transition_progress += 1
+            if self.transition_progress >= self.transition_frames:
+                self.in_transition = False
+                self.transition_progress = 0.0
+                self.last_valid_image = current_output
+                return current_output
+            
+            return output_image
+        
+        # Store last valid image
+        self.last_valid_image = current_output
+
+        return current_output
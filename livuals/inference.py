@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class InferenceExecutor:
+    """Ejecuta el trabajo de inferencia fuera del event loop de asyncio.
+
+    Un único hilo dedicado procesa los trabajos en orden (el modelo no es
+    thread-safe), y el loop espera los resultados a través de futures.
+    """
+
+    def __init__(self, pipeline, max_workers: int = 1):
+        self.pipeline = pipeline
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Encola `fn(*args)` en el hilo de inferencia y espera su resultado"""
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(self._call, fn, args)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    async def predict(self, params) -> Any:
+        return await self.run(self.pipeline.predict, params)
+
+    def _call(self, fn: Callable[..., Any], args) -> Any:
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def _on_done(self, future):
+        # Un trabajo cancelado antes de arrancar nunca pasa por _call
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        """Trabajos esperando turno (sin contar el que se está ejecutando)"""
+        return self._pending
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "queue_depth": self._pending,
+                "running": self._running,
+                "completed": self._completed,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence, Set, Tuple
+
+import torch
+
+
+class SessionLatents:
+    """Buffer de latentes del denoising batch, por sesión.
+
+    Con use_denoising_batch y más de un t_index, StreamDiffusion termina el
+    frame del slot j a partir de los latentes que dejó en
+    `x_t_latent_buffer` la entrada del slot j en la llamada anterior. Si el
+    slot cambia de sesión entre llamadas (batches armados por orden de
+    llegada, sesiones alternando en el mismo stream) una sesión recibiría
+    una imagen hecha con el frame de otra.
+
+    `route` se llama antes de cada llamada con la sesión de cada slot: si
+    la composición es la misma que la anterior no hace nada; si cambió,
+    guarda las filas del buffer de las sesiones salientes y arma el buffer
+    con las de las entrantes (ceros para una sesión nueva o un slot de
+    relleno, igual que después de prepare).
+
+    `route` corre en el hilo de inferencia; `forget` puede llamarse desde
+    cualquier hilo: solo anota la sesión y el próximo `route` la descarta.
+    """
+
+    def __init__(self, max_sessions: int = 64):
+        self.max_sessions = max_sessions
+        self.owners: Optional[Tuple[Hashable, ...]] = None
+        self.swaps = 0
+        self._states: "OrderedDict[Hashable, torch.Tensor]" = OrderedDict()
+        self._forgotten: Set[Hashable] = set()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def route(self, stream, owners: Sequence[Optional[Hashable]]):
+        """Deja en `stream.x_t_latent_buffer` los latentes de `owners`
+        (una sesión por slot, None para los de relleno)"""
+        self._drain_forgotten()
+        owners = tuple(owners)
+        buffer = getattr(stream, "x_t_latent_buffer", None)
+        if buffer is None or owners == self.owners:
+            self.owners = owners
+            return
+        frame_buffer_size = stream.frame_bff_size
+        # Filas del buffer: (t_index - 1) bloques de frame_buffer_size slots
+        rows = buffer.reshape(-1, frame_buffer_size, *buffer.shape[1:])
+        self._save(rows)
+        routed = torch.zeros_like(rows)
+        for slot, owner in enumerate(owners[:frame_buffer_size]):
+            state = self._states.get(owner) if owner is not None else None
+            if state is not None and state.shape == routed[:, slot].shape:
+                routed[:, slot] = state
+        stream.x_t_latent_buffer = routed.reshape(buffer.shape)
+        self.owners = owners
+        self.swaps += 1
+
+    def _save(self, rows: torch.Tensor):
+        """Guarda las filas de cada sesión de `self.owners`"""
+        for slot, owner in enumerate(self.owners or ()):
+            if owner is not None and slot < rows.shape[1]:
+                self._states[owner] = rows[:, slot].clone()
+                self._states.move_to_end(owner)
+        while len(self._states) > self.max_sessions:
+            self._states.popitem(last=False)
+
+    def release(self, stream):
+        """Otro stream del mismo bucket (con otro frame buffer) toma la
+        posta: las filas de un slot no dependen del tamaño del buffer, así
+        que las sesiones siguen en el nuevo desde donde quedaron"""
+        self._drain_forgotten()
+        buffer = getattr(stream, "x_t_latent_buffer", None)
+        if buffer is not None:
+            self._save(buffer.reshape(-1, stream.frame_bff_size, *buffer.shape[1:]))
+        self.owners = None
+
+    def forget(self, owner: Hashable):
+        """La sesión terminó: sus latentes se descartan en el próximo route"""
+        self._forgotten.add(owner)
+
+    def _drain_forgotten(self):
+        while self._forgotten:
+            try:
+                owner = self._forgotten.pop()
+            except KeyError:
+                break
+            self._states.pop(owner, None)
+            # Si todavía ocupa un slot no se guarda al salir del buffer
+            if self.owners and owner in self.owners:
+                self.owners = tuple(None if o == owner else o for o in self.owners)
+
+    def reset(self):
+        """El stream cambió (otro bucket o se recreó): los latentes guardados no sirven"""
+        self._states.clear()
+        self.owners = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sessions": len(self._states), "swaps": self.swaps}
@@ -2,6 +2,7 @@ from fastapi import FastAPI, WebSocket, HTTPException, WebSocketDisconnect
 from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.websockets import WebSocketState
 from fastapi import Request, UploadFile, File, Form
 
 import markdown2
@@ -18,10 +19,36 @@ import json
 import torch
 import os
 
+from adaptive import AdaptiveController
+from broadcast import Broadcaster, SharedFrame
 from config import config, Args
-from util import pil_to_frame, bytes_to_pil
+from util import decode_frame
+from encoder import FrameEncoder
+from frames import Frame
 from io import BytesIO
 from connection_manager import ConnectionManager, ServerFullException
+from inference import InferenceExecutor
+from metrics import REGISTRY, STAGE_SECONDS, STREAMS_RECLAIMED, timed
+from protocol import (
+    FLOW_LOCKSTEP,
+    OUTPUT_MJPEG,
+    OUTPUT_WS,
+    PROTOCOL_BINARY_V1,
+    PROTOCOL_LEGACY,
+    OutputTimings,
+    ProtocolError,
+    decode_input_frame,
+    encode_output_header,
+    negotiate_flow,
+    negotiate_output,
+    negotiate_protocol,
+)
+from params_cache import ParamsCache
+from prompt_bank import parse_entries
+from prompt_cache import PROMPT_CACHE
+from scheduler import BatchScheduler
+from stages import StagePipeline
+from tracing import FrameTrace, FrameTracer
 from img2img import Pipeline
 from main_shaders import add_shader_routes
 
@@ -29,6 +56,8 @@ from main_shaders import add_shader_routes
 mimetypes.add_type("application/javascript", ".js")
 
 THROTTLE = 1.0 / 120
+# Cada cuánto /api/stream revisa si el visor HTTP se desconectó
+DISCONNECT_POLL = 0.25
 # logging.basicConfig(level=logging.DEBUG)
 
 
@@ -37,9 +66,65 @@ class App:
         self.args = config
         self.pipeline = pipeline
         self.app = FastAPI()
-        self.conn_manager = ConnectionManager()
+        self.conn_manager = ConnectionManager(
+            config.mailbox_policy, config.mailbox_size, config.flow_credits
+        )
+        # predict corre en un hilo propio para no bloquear el event loop
+        self.inference = InferenceExecutor(pipeline)
+        self.encoder = FrameEncoder(
+            config.output_format,
+            config.output_quality,
+            config.chroma_subsampling,
+            config.encoder_workers,
+        )
+        # StagePipeline, AdaptiveController y FrameTracer de cada sesión, para /api/stats
+        self.stage_stats = {}
+        self.adaptive = {}
+        self.tracers = {}
+        # Visores de la salida de cada sesión (/api/broadcast)
+        self.broadcasts = {}
+        # Tareas sueltas (cierre de streams): el loop solo guarda referencias débiles
+        self._background_tasks = set()
+        self.scheduler = BatchScheduler(
+            self.inference,
+            pipeline,
+            window=config.batch_window_ms / 1000,
+            max_batch=config.max_batch_size,
+        )
+        self.init_metrics()
         self.init_app()
 
+    def init_metrics(self):
+        """Gauges de /api/metrics: se calculan solo cuando alguien scrapea"""
+        REGISTRY.gauge(
+            "livuals_active_sessions",
+            "Connected websocket sessions",
+            self.conn_manager.get_user_count,
+        )
+        REGISTRY.gauge(
+            "livuals_queue_depth",
+            "Frames or jobs waiting in each queue",
+            self.queue_depths,
+            ("queue",),
+        )
+        REGISTRY.gauge(
+            "livuals_broadcast_viewers",
+            "Viewers attached to /api/broadcast streams",
+            lambda: sum(len(b) for b in list(self.broadcasts.values())),
+        )
+
+    def queue_depths(self):
+        depths = {
+            ("mailbox",): self.conn_manager.get_pending_frames(),
+            ("inference",): self.inference.queue_depth,
+            ("scheduler",): self.scheduler.stats()["pending"],
+        }
+        for stages in list(self.stage_stats.values()):
+            for name, stats in stages.stats()["stages"].items():
+                key = (f"stage_{name}",)
+                depths[key] = depths.get(key, 0) + (stats.get("queue_depth") or 0)
+        return depths
+
     def init_app(self):
         class NoCacheStaticFiles(StaticFiles):
             async def get_response(self, path, scope):
@@ -57,15 +142,40 @@ class App:
         )
 
         @self.app.websocket("/api/ws/{user_id}")
-        async def websocket_endpoint(user_id: uuid.UUID, websocket: WebSocket):
+        async def websocket_endpoint(
+            user_id: uuid.UUID,
+            websocket: WebSocket,
+            protocol: str = PROTOCOL_LEGACY,
+            output: str = OUTPUT_MJPEG,
+            flow: str = FLOW_LOCKSTEP,
+        ):
+            output_task = None
             try:
+                output = negotiate_output(output)
                 await self.conn_manager.connect(
-                    user_id, websocket, self.args.max_queue_size
+                    user_id,
+                    websocket,
+                    self.args.max_queue_size,
+                    negotiate_protocol(protocol),
+                    output,
+                    negotiate_flow(flow),
                 )
+                self.tracers[user_id] = FrameTracer()
+                self.broadcasts[user_id] = Broadcaster()
+                if output == OUTPUT_WS:
+                    # La salida viaja por este mismo socket en lugar de /api/stream
+                    output_task = asyncio.create_task(send_output_frames(user_id))
                 await handle_websocket_data(user_id)
             except ServerFullException as e:
                 logging.error(f"Server Full: {e}")
             finally:
+                if output_task is not None:
+                    output_task.cancel()
+                self.scheduler.cancel(user_id)
+                self.tracers.pop(user_id, None)
+                broadcaster = self.broadcasts.pop(user_id, None)
+                if broadcaster is not None:
+                    broadcaster.close()
                 await self.conn_manager.disconnect(user_id)
                 logging.info(f"User disconnected: {user_id}")
 
@@ -73,6 +183,11 @@ class App:
             if not self.conn_manager.check_user(user_id):
                 return HTTPException(status_code=404, detail="User not found")
             last_time = time.time()
+            binary = self.conn_manager.get_protocol(user_id) == PROTOCOL_BINARY_V1
+            # Params validados de esta sesión, se revalidan solo cuando cambian
+            params_cache = ParamsCache(pipeline.InputParams)
+            # El flujo legacy no trae seq: se numera en el servidor
+            legacy_seq = 0
             try:
                 while True:
                     if (
@@ -88,82 +203,423 @@ class App:
                         )
                         await self.conn_manager.disconnect(user_id)
                         return
+                    if binary:
+                        if not await handle_binary_frame(user_id, params_cache):
+                            return
+                        continue
                     data = await self.conn_manager.receive_json(user_id)
                     if not data:
                         # client likely disconnected
                         return
+                    if data.get("status") == "displayed":
+                        handle_displayed(user_id, data)
+                        continue
                     if data.get("status") == "next_frame":
                         info = pipeline.Info()
-                        params = await self.conn_manager.receive_json(user_id)
-                        if not params:
+                        params_text = await self.conn_manager.receive_text(user_id)
+                        if not params_text:
                             return
-                        # Extract enableSpout before converting to InputParams
-                        enable_spout = params.get('enableSpout', True)
-                        # Remove enableSpout from params to avoid validation errors
-                        if 'enableSpout' in params:
-                            del params['enableSpout']
-                        params = pipeline.InputParams(**params)
-                        params = SimpleNamespace(**params.dict())
-                        # Add enableSpout back to params
-                        params.enableSpout = enable_spout
+                        params = params_cache.resolve(
+                            params_text, lambda: json.loads(params_text)
+                        )
                         if info.input_mode == "image":
                             image_data = await self.conn_manager.receive_bytes(user_id)
+                            granted_at = frame_arrived(user_id)
                             if len(image_data) == 0:
-                                await self.conn_manager.send_json(
-                                    user_id, {"status": "send_frame"}
-                                )
+                                await request_frame(user_id)
                                 continue
-                            params.image = bytes_to_pil(image_data)
+                            # Se decodifica recién al salir del buzón (ver ingest).
+                            # El cliente puede mandar seq y capture_ts en next_frame
+                            legacy_seq += 1
+                            seq, capture_ts = legacy_frame_stamp(user_id, data, legacy_seq)
+                            params = params._replace(
+                                image_data=image_data,
+                                seq=seq,
+                                capture_ts=capture_ts,
+                                received_at=time.time(),
+                                requested_at=granted_at,
+                            )
+                        else:
+                            params = params._replace(requested_at=frame_arrived(user_id))
                         await self.conn_manager.update_data(user_id, params)
 
             except Exception as e:
                 logging.error(f"Websocket Error: {e}, {user_id} ")
                 await self.conn_manager.disconnect(user_id)
 
+        async def handle_binary_frame(
+            user_id: uuid.UUID, params_cache: ParamsCache
+        ) -> bool:
+            """Procesa un frame del protocolo binary-v1. Devuelve False si el cliente se fue.
+            Los mensajes de texto son de control (p.ej. displayed)"""
+            data = await self.conn_manager.receive_message(user_id)
+            if data is None:
+                return False
+            if isinstance(data, str):
+                try:
+                    message = json.loads(data)
+                except ValueError:
+                    logging.warning(f"Protocol Error: invalid control message, {user_id} ")
+                    return True
+                if message.get("status") == "displayed":
+                    handle_displayed(user_id, message)
+                return True
+            # Todo mensaje binario responde a un send_frame, aunque sea inválido
+            granted_at = frame_arrived(user_id)
+            try:
+                frame = decode_input_frame(data)
+            except ProtocolError as e:
+                logging.warning(f"Protocol Error: {e}, {user_id} ")
+                await request_frame(user_id)
+                return True
+            if frame.params is not None:
+                # Los params solo viajan cuando cambian: se validan una vez por revisión.
+                # Si no validan no se cachean: el cliente los reenvía con params_required
+                try:
+                    params = params_cache.put(frame.params_rev, frame.params)
+                except (ValueError, TypeError) as e:
+                    logging.warning(f"Protocol Error: invalid params, {e}, {user_id} ")
+                    params = None
+            else:
+                params = params_cache.get(frame.params_rev)
+            if params is None:
+                await self.conn_manager.send_json(
+                    user_id, {"status": "params_required", "params_rev": frame.params_rev}
+                )
+                await request_frame(user_id)
+                return True
+            if len(frame.image) == 0:
+                await request_frame(user_id)
+                return True
+            params = params._replace(
+                received_at=time.time(),
+                requested_at=granted_at,
+                seq=frame.seq,
+                capture_ts=frame.capture_ts,
+                image_data=frame.image,
+            )
+            await self.conn_manager.update_data(user_id, params)
+            return True
+
+        async def request_frame(user_id: uuid.UUID):
+            """Pide un frame al cliente (con flow=credit, otorga un crédito)"""
+            await self.conn_manager.send_json(user_id, {"status": "send_frame"})
+            credits = self.conn_manager.get_credits(user_id)
+            if credits is not None:
+                credits.grant()
+
+        def frame_arrived(user_id: uuid.UUID):
+            """Cuenta la respuesta a un crédito; devuelve cuándo se otorgó"""
+            credits = self.conn_manager.get_credits(user_id)
+            if credits is None:
+                return None
+            return credits.arrived()
+
+        def handle_displayed(user_id: uuid.UUID, message):
+            """El cliente avisa cuándo mostró un frame: {status: displayed, seq, display_ts}"""
+            tracer = self.tracers.get(user_id)
+            if tracer is None:
+                return
+            try:
+                tracer.displayed(int(message["seq"]), float(message["display_ts"]))
+            except (KeyError, TypeError, ValueError):
+                logging.warning(f"Invalid displayed message: {message}, {user_id} ")
+
+        def legacy_frame_stamp(user_id: uuid.UUID, message, fallback_seq: int):
+            """seq y capture_ts opcionales de next_frame. Van al header de salida
+            (uint32 y double): si no son números se usa el seq propio y sin capture_ts"""
+            try:
+                seq = int(message.get("seq", fallback_seq)) & 0xFFFFFFFF
+            except (TypeError, ValueError, OverflowError):
+                logging.warning(f"Invalid next_frame seq: {message.get('seq')!r}, {user_id} ")
+                seq = fallback_seq
+            capture_ts = message.get("capture_ts")
+            if capture_ts is not None:
+                try:
+                    capture_ts = float(capture_ts)
+                except (TypeError, ValueError):
+                    logging.warning(f"Invalid next_frame capture_ts: {capture_ts!r}, {user_id} ")
+                    capture_ts = None
+            return seq, capture_ts
+
+        async def ingest(params):
+            """Decodifica el frame pendiente directo a la resolución de inferencia.
+            Corre fuera del event loop y solo para frames que no fueron descartados"""
+            if params.image_data is None:
+                return params
+            with timed("decode"):
+                image = await asyncio.to_thread(
+                    decode_frame,
+                    params.image_data,
+                    params.width,
+                    params.height,
+                    self.args.max_input_pixels,
+                )
+            return params._replace(image=Frame.from_array(image), image_data=None)
+
         @self.app.get("/api/queue")
         async def get_queue_size():
             queue_size = self.conn_manager.get_user_count()
             return JSONResponse({"queue_size": queue_size})
 
+        @self.app.get("/api/metrics")
+        async def metrics():
+            return Response(
+                REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+            )
+
+        @self.app.get("/api/latency/{user_id}")
+        async def session_latency(user_id: uuid.UUID):
+            tracer = self.tracers.get(user_id)
+            if tracer is None:
+                return JSONResponse({"error": "User not found"}, status_code=404)
+            return JSONResponse(tracer.stats())
+
+        @self.app.get("/api/stats/{user_id}")
+        async def session_stats(user_id: uuid.UUID):
+            mailbox = self.conn_manager.get_mailbox_stats(user_id)
+            if mailbox is None:
+                return JSONResponse({"error": "User not found"}, status_code=404)
+            stages = self.stage_stats.get(user_id)
+            controller = self.adaptive.get(user_id)
+            credits = self.conn_manager.get_credits(user_id)
+            broadcaster = self.broadcasts.get(user_id)
+            return JSONResponse(
+                {
+                    "mailbox": mailbox,
+                    "broadcast": broadcaster.stats() if broadcaster else None,
+                    "flow": credits.stats() if credits else None,
+                    "pipeline": stages.stats() if stages else None,
+                    "adaptive": controller.stats() if controller else None,
+                }
+            )
+
+        async def request_frames(user_id: uuid.UUID):
+            """Fuente del loop de inferencia: pide frames al cliente y espera al buzón.
+            En lockstep pide uno por vez; con flow=credit mantiene la ventana de
+            créditos llena para que el próximo frame ya esté esperando"""
+            credits = self.conn_manager.get_credits(user_id)
+            while True:
+                requested_at = time.time()
+                if credits is None:
+                    await request_frame(user_id)
+                    params = await self.conn_manager.get_latest_data(user_id)
+                else:
+                    for _ in range(credits.needed(self.conn_manager.get_pending(user_id))):
+                        await request_frame(user_id)
+                    try:
+                        params = await asyncio.wait_for(
+                            self.conn_manager.get_latest_data(user_id),
+                            credits.stall_timeout(),
+                        )
+                    except asyncio.TimeoutError:
+                        # Créditos perdidos (frame descartado por el cliente, etc.)
+                        credits.reset()
+                        continue
+                    credits.consumed()
+                if params is None:
+                    # La sesión se cerró: el buzón ya no va a recibir frames
+                    return
+                requested_at = params.requested_at or requested_at
+                # Ida y vuelta: desde el pedido hasta que el frame sale del buzón
+                STAGE_SECONDS.observe(time.time() - requested_at, "receive")
+                yield SimpleNamespace(params=params, requested_at=requested_at)
+
+        def frame_stages(user_id: uuid.UUID, output: str, controller: AdaptiveController):
+            async def decode(frame):
+                try:
+                    # Resolución y steps efectivos antes de decodificar al tamaño de inferencia
+                    frame.params = await ingest(controller.apply(frame.params))
+                except Exception as e:
+                    logging.warning(f"Decode Error: {e}, {user_id} ")
+                    return None
+                return frame
+
+            async def infer(frame):
+                await self.conn_manager.send_json(user_id, {"status": "inference_start"})
+                frame.infer_start = time.time()
+                frame.image = await self.scheduler.submit(user_id, frame.params)
+                frame.infer_end = time.time()
+                if frame.image is None:
+                    await send_inference_end(user_id, frame)
+                    return None
+                return frame
+
+            async def encode(frame):
+                prefix = None
+                if output == OUTPUT_WS:
+                    params = frame.params
+                    received_at = params.received_at or frame.infer_start
+
+                    def prefix(encode_ms):
+                        return encode_output_header(
+                            OutputTimings(
+                                seq=params.seq or 0,
+                                capture_ts=params.capture_ts or 0.0,
+                                received_ts=received_at * 1000,
+                                sent_ts=time.time() * 1000,
+                                queue_ms=(frame.infer_start - received_at) * 1000,
+                                infer_ms=(frame.infer_end - frame.infer_start) * 1000,
+                                encode_ms=encode_ms,
+                            )
+                        )
+
+                frame.encoded = await self.encoder.encode(
+                    frame.image,
+                    multipart=output == OUTPUT_MJPEG,
+                    prefix=prefix,
+                    quality=controller.quality if controller.enabled else None,
+                )
+                return frame
+
+            return [("decode", decode), ("infer", infer), ("encode", encode)]
+
+        async def send_inference_end(user_id: uuid.UUID, frame):
+            encoded = getattr(frame, "encoded", None)
+            frame.took = time.time() - frame.requested_at
+            await self.conn_manager.send_json(
+                user_id,
+                {
+                    "status": "inference_end",
+                    "seq": frame.params.seq,
+                    "took": round(frame.took, 3),
+                    "encode_ms": round(encoded.encode_ms, 2) if encoded else None,
+                },
+            )
+            if self.args.debug:
+                print(f"Time taken: {time.time() - frame.requested_at}")
+
+        async def produce_frames(user_id: uuid.UUID, output: str = OUTPUT_MJPEG):
+            """Loop de inferencia de una sesión: pide frames al cliente, decodifica,
+            infiere y codifica. Con --pipelined las etapas se solapan entre frames.
+            Con OUTPUT_WS cada frame sale con el header binario de salida.
+            Con --target-fps/--target-latency-ms un AdaptiveController ajusta
+            calidad, steps y resolución y le avisa al cliente cada decisión"""
+            controller = AdaptiveController(
+                target_fps=self.args.target_fps,
+                target_latency_ms=self.args.target_latency_ms,
+                quality=self.args.output_quality,
+                min_quality=self.args.adaptive_min_quality,
+                scale_steps=getattr(pipeline, "steps_cost_time", True),
+            )
+            stages = StagePipeline(
+                frame_stages(user_id, output, controller), pipelined=self.args.pipelined
+            )
+            self.stage_stats[user_id] = stages
+            self.adaptive[user_id] = controller
+            try:
+                async for frame in stages.run(request_frames(user_id)):
+                    logging.info(f"Yielding frame: {len(frame.encoded.data)} bytes to {user_id}")
+                    broadcaster = self.broadcasts.get(user_id)
+                    if broadcaster is not None and broadcaster.has_viewers:
+                        # Mismo frame codificado para todos los visores, sin recodificar
+                        broadcaster.publish(
+                            SharedFrame(frame.encoded, output == OUTPUT_MJPEG, frame.params.seq)
+                        )
+                    await send_inference_end(user_id, frame)
+                    if controller.observe(frame.took):
+                        await self.conn_manager.send_json(user_id, controller.decision())
+                    # Escritura al socket (ws) o al StreamingResponse (MJPEG)
+                    with timed("send"):
+                        yield frame.encoded
+                    trace_frame(user_id, frame)
+            except Exception as e:
+                logging.error(f"Prediction Error: {e}")
+                # Inform UI clearly and stop stream
+                await self.conn_manager.send_json(
+                    user_id,
+                    {"status": "error", "message": f"Prediction failed: {str(e)}"},
+                )
+            finally:
+                if self.stage_stats.get(user_id) is stages:
+                    del self.stage_stats[user_id]
+                if self.adaptive.get(user_id) is controller:
+                    del self.adaptive[user_id]
+
+        def trace_frame(user_id: uuid.UUID, frame):
+            tracer = self.tracers.get(user_id)
+            if tracer is None or frame.params.seq is None:
+                return
+            received_at = frame.params.received_at or frame.requested_at
+            tracer.sent(
+                FrameTrace(
+                    seq=frame.params.seq,
+                    capture_ts=frame.params.capture_ts,
+                    received_ts=received_at * 1000,
+                    sent_ts=time.time() * 1000,
+                    queue_ms=(frame.infer_start - received_at) * 1000,
+                    infer_ms=(frame.infer_end - frame.infer_start) * 1000,
+                    encode_ms=frame.encoded.encode_ms,
+                )
+            )
+
+        async def send_output_frames(user_id: uuid.UUID):
+            try:
+                async for encoded in produce_frames(user_id, OUTPUT_WS):
+                    await self.conn_manager.send_bytes(user_id, encoded.data)
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logging.error(f"Output Error: {e}, {user_id} ")
+
+        async def wait_disconnected(request: Request):
+            while not await request.is_disconnected():
+                await asyncio.sleep(DISCONNECT_POLL)
+
+        async def close_frames(frames, pending):
+            """Cancela la espera en curso y cierra el generador de frames.
+            Corre en su propia tarea: el scope de la respuesta puede estar cancelado"""
+            if pending is not None and not pending.done():
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+            await frames.aclose()
+
         @self.app.get("/api/stream/{user_id}")
         async def stream(user_id: uuid.UUID, request: Request):
+            if not self.conn_manager.check_user(user_id):
+                return JSONResponse({"error": "User not found"}, status_code=404)
+            if self.conn_manager.get_output(user_id) == OUTPUT_WS:
+                # La sesión ya produce su salida por el websocket: un segundo
+                # loop de inferencia competiría por sus frames
+                return JSONResponse(
+                    {"error": "Session output goes over its websocket", "broadcast": f"/api/broadcast/{user_id}"},
+                    status_code=409,
+                )
             try:
 
                 async def generate():
-                    while True:
-                        last_time = time.time()
-                        await self.conn_manager.send_json(
-                            user_id, {"status": "send_frame"}
-                        )
-                        params = await self.conn_manager.get_latest_data(user_id)
-                        if params is None:
-                            continue
-                        await self.conn_manager.send_json(user_id, {"status": "inference_start"})
-                        try:
-                            image = pipeline.predict(params)
-                            if image is None:
-                                continue
-                            frame = pil_to_frame(image)
-                            logging.info(f"Yielding frame: {len(frame)} bytes to {user_id}")
-                            yield frame
-                        except Exception as e:
-                            logging.error(f"Prediction Error: {e}")
-                            # Inform UI clearly and stop stream
-                            await self.conn_manager.send_json(
-                                user_id,
-                                {"status": "error", "message": f"Prediction failed: {str(e)}"},
-                            )
-                            break
-                        finally:
-                            await self.conn_manager.send_json(
-                                user_id,
-                                {
-                                    "status": "inference_end",
-                                    "took": round(time.time() - last_time, 3),
-                                },
+                    """Cada frame se espera en carrera con la desconexión del visor:
+                    si se va, se cancela la espera y se libera el lugar de la sesión
+                    en el scheduler sin esperar al próximo frame"""
+                    frames = produce_frames(user_id)
+                    disconnected = asyncio.ensure_future(wait_disconnected(request))
+                    # Si Starlette cierra el generador es porque el visor se fue
+                    reason = "viewer_disconnected"
+                    next_frame = None
+                    try:
+                        while True:
+                            next_frame = asyncio.ensure_future(frames.__anext__())
+                            await asyncio.wait(
+                                {next_frame, disconnected},
+                                return_when=asyncio.FIRST_COMPLETED,
                             )
-                        if self.args.debug:
-                            print(f"Time taken: {time.time() - last_time}")
+                            if not next_frame.done():
+                                break
+                            try:
+                                encoded = next_frame.result()
+                            except StopAsyncIteration:
+                                reason = "session_closed"
+                                break
+                            yield encoded.data
+                    finally:
+                        disconnected.cancel()
+                        # Sin esperar: Starlette puede estar cancelando este generador
+                        closing = asyncio.ensure_future(close_frames(frames, next_frame))
+                        self._background_tasks.add(closing)
+                        closing.add_done_callback(self._background_tasks.discard)
+                        self.scheduler.cancel(user_id)
+                        STREAMS_RECLAIMED.inc(1, reason)
+                        logging.info(f"Stream closed ({reason}): {user_id}")
 
                 return StreamingResponse(
                     generate(),
@@ -174,6 +630,76 @@ class App:
                 logging.error(f"Streaming Error: {e}, {user_id} ")
                 return HTTPException(status_code=404, detail="User not found")
 
+        async def next_viewer_frame(slot, gone):
+            """Próximo frame del buzón de un visor, o None si el visor o la sesión se fueron"""
+            next_frame = asyncio.ensure_future(slot.get())
+            await asyncio.wait({next_frame, gone}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_frame.done():
+                next_frame.cancel()
+                return None
+            return next_frame.result()
+
+        @self.app.get("/api/broadcast/{user_id}")
+        async def broadcast_stream(user_id: uuid.UUID, request: Request):
+            """MJPEG de la salida de una sesión para visores extra (pantallas, OBS).
+            No corre otro loop de inferencia: reparte los frames que ya produce la sesión"""
+            broadcaster = self.broadcasts.get(user_id)
+            if broadcaster is None:
+                return JSONResponse({"error": "User not found"}, status_code=404)
+            viewer_id, slot = broadcaster.subscribe()
+
+            async def generate():
+                gone = asyncio.ensure_future(wait_disconnected(request))
+                try:
+                    while True:
+                        frame = await next_viewer_frame(slot, gone)
+                        if frame is None:
+                            break
+                        yield frame.multipart(self.encoder)
+                finally:
+                    gone.cancel()
+                    broadcaster.unsubscribe(viewer_id)
+
+            return StreamingResponse(
+                generate(),
+                media_type="multipart/x-mixed-replace;boundary=frame",
+                headers={"Cache-Control": "no-cache"},
+            )
+
+        @self.app.websocket("/api/broadcast/{user_id}/ws")
+        async def broadcast_websocket(user_id: uuid.UUID, websocket: WebSocket):
+            """Lo mismo que /api/broadcast por websocket: un mensaje binario
+            con la imagen codificada por frame"""
+            await websocket.accept()
+            broadcaster = self.broadcasts.get(user_id)
+            if broadcaster is None:
+                await websocket.send_json({"status": "error", "message": "User not found"})
+                await websocket.close()
+                return
+            viewer_id, slot = broadcaster.subscribe()
+
+            async def wait_closed():
+                try:
+                    while (await websocket.receive())["type"] != "websocket.disconnect":
+                        pass
+                except Exception:
+                    pass
+
+            gone = asyncio.ensure_future(wait_closed())
+            try:
+                while True:
+                    frame = await next_viewer_frame(slot, gone)
+                    if frame is None:
+                        break
+                    await websocket.send_bytes(frame.payload())
+            except Exception as e:
+                logging.info(f"Broadcast viewer closed: {e}, {user_id} ")
+            finally:
+                gone.cancel()
+                broadcaster.unsubscribe(viewer_id)
+                if websocket.client_state == WebSocketState.CONNECTED:
+                    await websocket.close()
+
         # route to setup frontend
         @self.app.get("/api/settings")
         async def settings():
@@ -209,8 +735,50 @@ class App:
                 {
                     "ready": getattr(pipeline, "ready", True),
                     "busy": getattr(pipeline, "busy", False),
+                    "inference": self.inference.stats(),
+                    "scheduler": self.scheduler.stats(),
+                    "encoder": self.encoder.stats(),
+                    "sinks": pipeline.frame_bus.stats() if hasattr(pipeline, "frame_bus") else None,
+                    "schedule_cache": (
+                        pipeline.schedule_cache.stats() if hasattr(pipeline, "schedule_cache") else None
+                    ),
+                    "prompt_cache": PROMPT_CACHE.stats(),
+                    "pipeline_pool": (
+                        pipeline.pipeline_pool.stats() if getattr(pipeline, "pipeline_pool", None) else None
+                    ),
+                    "engines": (
+                        dict(pipeline.engine_manifest.stats(), ready=[f"{w}x{h}" for w, h in pipeline.ready_buckets()])
+                        if getattr(pipeline, "engine_manifest", None) else None
+                    ),
+                    "prompt_bank": (
+                        {"size": len(pipeline.prompt_bank), "ready": pipeline.prompt_bank.ready}
+                        if hasattr(pipeline, "prompt_bank") else None
+                    ),
                 }
             )
+
+        @self.app.get("/api/prompt-bank")
+        async def get_prompt_bank():
+            if not hasattr(pipeline, "prompt_bank"):
+                return JSONResponse({"status": "error", "message": "Prompt bank no disponible"}, status_code=404)
+            return JSONResponse(pipeline.prompt_bank.stats())
+
+        @self.app.post("/api/prompt-bank")
+        async def load_prompt_bank(request: Request):
+            """Carga la lista de prompts del set: {"prompts": ["...", {"prompt": "...", "at": 12.5}]}.
+            Los clientes eligen después con los params prompt_index / prompt_mix_index / prompt_mix"""
+            if not hasattr(pipeline, "prompt_bank"):
+                return JSONResponse({"status": "error", "message": "Prompt bank no disponible"}, status_code=404)
+            try:
+                body = await request.json()
+                items = body.get("prompts") if isinstance(body, dict) else body
+                if not isinstance(items, list):
+                    raise ValueError("Se espera una lista en 'prompts'")
+                entries = parse_entries(items)
+            except ValueError as e:
+                return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+            pipeline.prompt_bank.load(entries)
+            return JSONResponse({"status": "success", **pipeline.prompt_bank.stats()})
             
         @self.app.get("/api/ping")
         async def ping():
@@ -221,7 +789,8 @@ class App:
         async def release_resources():
             try:
                 if hasattr(pipeline, "release_resources"):
-                    pipeline.release_resources()
+                    # Serializado con la inferencia para no liberar el modelo a mitad de un frame
+                    await self.inference.run(pipeline.release_resources)
                     return JSONResponse({"status": "success", "message": "Recursos liberados correctamente"})
                 return JSONResponse({"status": "warning", "message": "Método release_resources no disponible"})
             except Exception as e:
@@ -346,10 +915,12 @@ class App:
                     if image is None:
                         raise HTTPException(status_code=400, detail="image required for image mode")
                     data = await image.read()
-                    p.image = bytes_to_pil(data)
-                img = pipeline.predict(p)
+                    p.image = Frame.from_array(
+                        decode_frame(data, p.width, p.height, self.args.max_input_pixels)
+                    )
+                img = await self.inference.predict(p)
                 buf = BytesIO()
-                img.save(buf, format="JPEG")
+                img.to_pil().save(buf, format="JPEG")
                 content = buf.getvalue()
                 headers = {"Content-Disposition": "attachment; filename=livuals_snapshot.jpg"}
                 return Response(content=content, media_type="image/jpeg", headers=headers)
@@ -0,0 +1,187 @@
+"""Métricas en formato de texto de Prometheus, sin dependencias.
+
+Los histogramas guardan conteos por bucket (no acumulados) y se acumulan
+recién al renderizar, así `observe` es un bisect y un par de sumas. Los
+gauges se calculan con callbacks en el momento del scrape: si nadie consulta
+/api/metrics no cuestan nada.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [conteo por bucket (+Inf al final), suma, total]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Gauge:
+    """Gauge calculado en el scrape. `fn` devuelve un número o, si hay
+    labels, un dict {valores de labels: número}"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], GaugeValue],
+        labelnames: Sequence[str] = (),
+    ):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.fn()
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, v in values:
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}"
+            )
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Union[Histogram, Counter, Gauge]] = {}
+
+    def register(self, metric):
+        # Registrar con el mismo nombre reemplaza (p.ej. gauges de una App nueva)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, **kwargs))
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, fn, labelnames))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Latencia por etapa del camino de un frame: receive, params, decode,
+# prompt (solo si el embedding no estaba cacheado), preprocess, denoise,
+# blend, encode, send y un label por sink del FrameBus (spout, shm, ...)
+STAGE_SECONDS = REGISTRY.histogram(
+    "livuals_stage_seconds", "Time spent per frame in each pipeline stage", ("stage",)
+)
+FRAMES_DROPPED = REGISTRY.counter(
+    "livuals_frames_dropped_total", "Incoming frames discarded before inference", ("reason",)
+)
+STREAMS_RECLAIMED = REGISTRY.counter(
+    "livuals_streams_reclaimed_total",
+    "Output streams torn down because the viewer or the session went away",
+    ("reason",),
+)
+
+
+def timed(stage: str):
+    """`with timed("decode"): ...` registra la duración en STAGE_SECONDS"""
+    return STAGE_SECONDS.time(stage)
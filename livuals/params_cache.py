@@ -0,0 +1,81 @@
+import itertools
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Optional, Type
+
+from metrics import STAGE_SECONDS
+
+# Campos por frame que se completan con _replace sobre los params cacheados.
+# image_data son los bytes crudos recibidos; image es el frame ya decodificado.
+# requested_at es cuándo se otorgó el crédito que respondió (flow=credit).
+# session es la sesión dueña del frame (la completa BatchScheduler.submit).
+FRAME_FIELDS = ("image", "image_data", "seq", "capture_ts", "received_at", "requested_at", "session")
+
+_revisions = itertools.count(1)
+
+
+def new_revision() -> int:
+    """Revisión única en el proceso, para params derivados de otros ya cacheados"""
+    return next(_revisions)
+
+
+@lru_cache(maxsize=None)
+def params_type(input_params_cls: Type) -> Type[tuple]:
+    """Namedtuple inmutable con los campos de InputParams más los extras del frame"""
+    fields = tuple(input_params_cls.__fields__) + ("enableSpout", "revision") + FRAME_FIELDS
+    return namedtuple("FrameParams", fields, defaults=(None,) * len(FRAME_FIELDS))
+
+
+class ParamsCache:
+    """Cache por sesión de InputParams ya validados.
+
+    Las entradas se indexan por el texto JSON recibido (protocolo legacy) o por
+    la revisión que manda el cliente (protocolo binario). Mientras los params no
+    cambien no se vuelve a validar ni a crear el objeto: cada frame solo hace un
+    `_replace` con la imagen. Cada entrada nueva recibe un `revision` único en
+    el proceso, así `Pipeline.predict` detecta cambios comparando un entero.
+    """
+
+    def __init__(self, input_params_cls: Type, max_entries: int = 16):
+        self.input_params_cls = input_params_cls
+        self.params_type = params_type(input_params_cls)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[tuple]:
+        params = self._entries.get(key)
+        if params is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return params
+
+    def put(self, key: Hashable, raw: Dict[str, Any]) -> tuple:
+        """Valida `raw` contra InputParams y lo guarda bajo `key`"""
+        self.misses += 1
+        start = time.perf_counter()
+        raw = dict(raw)
+        enable_spout = raw.pop("enableSpout", True)
+        validated = self.input_params_cls(**raw).dict()
+        STAGE_SECONDS.observe(time.perf_counter() - start, "params")
+        params = self.params_type(
+            **validated, enableSpout=enable_spout, revision=new_revision()
+        )
+        self._entries[key] = params
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return params
+
+    def resolve(self, key: Hashable, load) -> tuple:
+        """Devuelve los params de `key`, validando `load()` solo si no están cacheados"""
+        params = self.get(key)
+        if params is None:
+            params = self.put(key, load())
+        return params
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,235 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+Bucket = Tuple[int, int]
+
+
+def resolution_buckets(minimum: int = 256, maximum: int = 512, step: int = 64) -> List[Bucket]:
+    """Grilla de resoluciones de los sliders de width/height"""
+    sizes = range(minimum, maximum + 1, step)
+    return [(w, h) for w in sizes for h in sizes]
+
+
+def parse_buckets(spec: Optional[str], grid: List[Bucket]) -> List[Bucket]:
+    """"all" → toda la grilla; "512x512,384x384" → esos; vacío → ninguno"""
+    if not spec:
+        return []
+    if spec.strip().lower() == "all":
+        return list(grid)
+    buckets = []
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        width, _, height = item.partition("x")
+        bucket = (int(width), int(height or width))
+        if bucket not in grid:
+            raise ValueError(f"{bucket[0]}x{bucket[1]} no está en la grilla de resoluciones")
+        buckets.append(bucket)
+    return buckets
+
+
+class PrewarmCancelled(Exception):
+    """Un frame pidió un build mientras el prewarm tenía el lock: el build
+    del prewarm se corta en la próxima etapa y el bucket se reintenta después"""
+
+
+class PoolEntry:
+    __slots__ = ("value", "bytes", "build_s", "uses")
+
+    def __init__(self, value: Any, size: int, build_s: float):
+        self.value = value
+        self.bytes = size
+        self.build_s = build_s
+        self.uses = 0
+
+
+class PipelinePool:
+    """Pipelines listos por bucket de resolución, con LRU acotado por memoria.
+
+    Cambiar width/height reconstruía el StreamDiffusionWrapper completo
+    (modelo, warmup y, con TensorRT, quizás el engine). El pool guarda los
+    pipelines ya armados: volver a un bucket conocido es un cambio de
+    referencia. `budget_bytes` acota la memoria de los que no están en uso
+    (el activo nunca se desaloja); 0 guarda solo el activo, como antes.
+
+    `build(bucket, wait_idle)` arma el pipeline y llama a `wait_idle()` entre
+    sus etapas (carga, schedules, cada pasada de warmup): en el prewarm espera
+    a que la inferencia quede libre, o lanza PrewarmCancelled si un frame
+    espera un build; en un build pedido por un frame no hace nada. `memory()` mide la memoria usada (p.ej.
+    torch.cuda.memory_allocated) para estimar cuánto ocupa cada uno y
+    `release(value)` lo libera al desalojarlo.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[Hashable, Callable[[], None]], Any],
+        budget_bytes: int = 0,
+        memory: Callable[[], int] = lambda: 0,
+        release: Callable[[Any], None] = lambda value: None,
+    ):
+        self.build = build
+        self.budget_bytes = budget_bytes
+        self.memory = memory
+        self.release = release
+        self.active: Optional[Hashable] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prewarmed = 0
+        self._entries: "OrderedDict[Hashable, PoolEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Un solo build a la vez (el de un frame espera al del prewarm y viceversa)
+        self._build_lock = threading.Lock()
+        # Builds pedidos por un frame (acquire) esperando el _build_lock
+        self._foreground_builds = 0
+        self._prewarm_generation = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def bytes(self) -> int:
+        return sum(entry.bytes for entry in self._entries.values())
+
+    def _build(self, key: Hashable, wait_idle: Callable[[], None] = lambda: None) -> PoolEntry:
+        with self._build_lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+            before = self.memory()
+            start = time.perf_counter()
+            value = self.build(key, wait_idle)
+            entry = PoolEntry(value, max(0, self.memory() - before), time.perf_counter() - start)
+            with self._lock:
+                self._entries[key] = entry
+            return entry
+
+    def acquire(self, key: Hashable) -> Any:
+        """Pipeline del bucket `key` (lo arma si no está) y lo marca activo"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+        if entry is None:
+            self.misses += 1
+            with self._lock:
+                self._foreground_builds += 1
+            try:
+                entry = self._build(key)
+            finally:
+                with self._lock:
+                    self._foreground_builds -= 1
+        with self._lock:
+            self._entries.move_to_end(key)
+            entry.uses += 1
+            self.active = key
+            self._evict()
+        return entry.value
+
+    def _idle_bytes(self) -> int:
+        return sum(entry.bytes for key, entry in self._entries.items() if key != self.active)
+
+    def _evict(self):
+        """Desaloja los menos usados recientemente hasta que los inactivos
+        entren en el presupuesto"""
+        for key in [key for key in self._entries if key != self.active]:
+            if self._idle_bytes() <= self.budget_bytes:
+                break
+            self._discard(key)
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.evictions += 1
+        try:
+            self.release(entry.value)
+        except Exception as e:
+            logging.warning(f"Pipeline pool: error liberando {key}: {e}")
+
+    def prewarm(self, keys: Iterable[Hashable], is_busy: Callable[[], bool] = lambda: False, idle_poll: float = 0.05):
+        """Arma en segundo plano los buckets que falten, solo con la
+        inferencia libre, y para cuando el presupuesto se llena"""
+        self._prewarm_generation += 1
+        generation = self._prewarm_generation
+        pending = [key for key in keys if key not in self._entries]
+
+        def wait_idle():
+            # También entre etapas del build: que el prewarm no compita por la
+            # GPU con un frame. Si un frame espera el _build_lock, que tiene el
+            # prewarm, se corta el build para soltarlo
+            while True:
+                if self._foreground_builds:
+                    raise PrewarmCancelled()
+                if not is_busy() or generation != self._prewarm_generation:
+                    return
+                time.sleep(idle_poll)
+
+        def run():
+            while pending:
+                key = pending.pop(0)
+                # Entre builds, esperar a que termine el de un frame
+                while self._foreground_builds and generation == self._prewarm_generation:
+                    time.sleep(idle_poll)
+                try:
+                    wait_idle()
+                    if generation != self._prewarm_generation or key in self._entries:
+                        continue
+                    entry = self._build(key, wait_idle)
+                except PrewarmCancelled:
+                    logging.info(f"Pipeline pool: prewarm de {key} cortado por un build pedido por un frame")
+                    pending.insert(0, key)
+                    continue
+                except Exception as e:
+                    logging.warning(f"Pipeline pool: no se pudo precalentar {key}: {e}")
+                    continue
+                with self._lock:
+                    self.prewarmed += 1
+                    # Lo recién armado va al frente del LRU: si no entra, se
+                    # desaloja él y no uno que se usó de verdad
+                    self._entries.move_to_end(key, last=False)
+                    self._evict()
+                    if key not in self._entries:
+                        logging.info(f"Pipeline pool: presupuesto lleno, prewarm detenido en {key}")
+                        return
+                print(f"Pipeline {key} precalentado en {entry.build_s:.1f}s")
+
+        thread = threading.Thread(target=run, name="pipeline-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        """Libera todo (también el activo) y corta un prewarm en curso"""
+        self._prewarm_generation += 1
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+            self.active = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = {
+                "x".join(map(str, key)) if isinstance(key, tuple) else str(key): {
+                    "mb": round(entry.bytes / 2**20, 1),
+                    "build_s": round(entry.build_s, 2),
+                    "uses": entry.uses,
+                }
+                for key, entry in self._entries.items()
+            }
+        lookups = self.hits + self.misses
+        return {
+            "active": "x".join(map(str, self.active)) if isinstance(self.active, tuple) else self.active,
+            "entries": entries,
+            "mb": round(self.bytes / 2**20, 1),
+            "budget_mb": round(self.budget_bytes / 2**20, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "prewarmed": self.prewarmed,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
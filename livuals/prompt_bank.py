@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+try:
+    import torch
+except Exception:
+    torch = None  # type: ignore
+
+
+class BankEntry(NamedTuple):
+    prompt: str
+    at: Optional[float] = None  # segundos desde el inicio del set (opcional)
+
+
+def parse_entries(items: List[Any]) -> List[BankEntry]:
+    """Acepta strings o dicts {"prompt": ..., "at": ...}"""
+    entries = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            entries.append(BankEntry(item))
+        elif isinstance(item, dict) and isinstance(item.get("prompt"), str):
+            at = item.get("at")
+            entries.append(BankEntry(item["prompt"], float(at) if at is not None else None))
+        else:
+            raise ValueError(f"Entrada {i} inválida: se espera un string o {{\"prompt\", \"at\"}}")
+    return entries
+
+
+class PromptBank:
+    """Banco de prompts de un set en vivo, con el conditioning precalculado.
+
+    `load` reemplaza la lista y un hilo de baja prioridad codifica los
+    prompts de a uno, solo mientras la inferencia está libre (`is_busy`),
+    así el precalculo no le roba tiempo a los frames. Cada embedding queda
+    referenciado por el banco (el LRU de prompts no lo puede desalojar) y
+    cambiar de prompt por índice no vuelve a pasar por el encoder.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[str], Any],
+        is_busy: Callable[[], bool] = lambda: False,
+        idle_poll: float = 0.005,
+    ):
+        self.encode = encode
+        self.is_busy = is_busy
+        self.idle_poll = idle_poll
+        self.entries: List[BankEntry] = []
+        self.generation = 0
+        self.encode_ms = 0.0
+        self.errors = 0
+        self._embeddings: List[Any] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def ready(self) -> int:
+        with self._lock:
+            return sum(e is not None for e in self._embeddings)
+
+    def valid(self, index: Optional[int]) -> bool:
+        return index is not None and 0 <= index < len(self.entries)
+
+    def load(self, entries: List[BankEntry]):
+        # entries y embeddings se reemplazan juntos: quien lee bajo el lock ve
+        # siempre los dos de la misma generación
+        with self._lock:
+            self.generation += 1
+            self.entries = list(entries)
+            self._embeddings = [None] * len(entries)
+            self.encode_ms = 0.0
+            generation = self.generation
+        self._thread = threading.Thread(
+            target=self._precompute, args=(generation,), name="prompt-bank", daemon=True
+        )
+        self._thread.start()
+
+    def _pending(self, index: int, generation: int) -> bool:
+        with self._lock:
+            return generation == self.generation and self._embeddings[index] is None
+
+    def _precompute(self, generation: int):
+        try:
+            # Linux: nice del hilo (no del proceso); en otros sistemas no hace nada
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except Exception:
+            pass
+        with self._lock:
+            size = len(self.entries)
+        for index in range(size):
+            while self.is_busy():
+                if generation != self.generation:
+                    return
+                time.sleep(self.idle_poll)
+            if generation != self.generation:
+                return
+            if not self._pending(index, generation):
+                continue
+            try:
+                self._encode(index, generation)
+            except Exception as e:
+                self.errors += 1
+                logging.warning(f"Prompt bank: no se pudo codificar {index}: {e}")
+
+    def _encode(self, index: int, generation: int) -> Any:
+        with self._lock:
+            if generation != self.generation:
+                raise IndexError(f"Prompt bank generation {generation} was replaced")
+            prompt = self.entries[index].prompt
+        start = time.perf_counter()
+        embedding = self.encode(prompt)
+        with self._lock:
+            if generation == self.generation and self._embeddings[index] is None:
+                self._embeddings[index] = embedding
+                self.encode_ms += (time.perf_counter() - start) * 1000
+        return embedding
+
+    def embedding(self, index: int) -> Any:
+        """Conditioning del prompt `index`. Si el hilo todavía no llegó, se
+        codifica ahora (una sola vez)"""
+        with self._lock:
+            if not 0 <= index < len(self.entries):
+                raise IndexError(f"Prompt bank index {index} out of range ({len(self.entries)})")
+            embedding = self._embeddings[index]
+            generation = self.generation
+        if embedding is None:
+            embedding = self._encode(index, generation)
+        return embedding
+
+    def mix(self, index: int, other: Optional[int] = None, t: float = 0.0) -> Any:
+        """Interpolación lineal entre dos prompts del banco (t=0: `index`, t=1: `other`).
+        Un `other` fuera de rango se ignora"""
+        start = self.embedding(index)
+        if not self.valid(other) or t <= 0.0:
+            return start
+        end = self.embedding(other)
+        if t >= 1.0:
+            return end
+        return torch.lerp(start, end, float(t))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = [
+                {"index": i, "prompt": e.prompt, "at": e.at, "ready": self._embeddings[i] is not None}
+                for i, e in enumerate(self.entries)
+            ]
+            return {
+                "generation": self.generation,
+                "size": len(entries),
+                "ready": sum(entry["ready"] for entry in entries),
+                "encode_ms": round(self.encode_ms, 1),
+                "errors": self.errors,
+                "entries": entries,
+            }
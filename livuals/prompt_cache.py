@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import REGISTRY
+
+PROMPT_CACHE_LOOKUPS = REGISTRY.counter(
+    "livuals_prompt_cache_lookups_total",
+    "Prompt embedding cache lookups by result",
+    ("result",),
+)
+
+CacheKey = Tuple[str, str]
+
+
+def tensor_bytes(value: Any) -> int:
+    """Bytes de un tensor (o de una tupla/lista de tensores)"""
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_bytes(v) for v in value)
+    if hasattr(value, "element_size") and hasattr(value, "numel"):
+        return value.element_size() * value.numel()
+    return getattr(value, "nbytes", 0)
+
+
+class PromptEmbeddingCache:
+    """LRU de embeddings de texto compartido por todo el proceso, acotado
+    por memoria. La clave es (modelo, texto del prompt): dos sesiones con el
+    mismo prompt comparten el mismo tensor y el encoder de texto corre una
+    sola vez.
+
+    Los tensores cacheados no se modifican: quien los use y necesite
+    cambiarlos tiene que copiarlos.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: CacheKey, value: Any):
+        size = tensor_bytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            self._evict()
+
+    def get_or_encode(self, model: str, prompt: str, encode: Callable[[str], Any]) -> Any:
+        """Embedding de `prompt`; si no está, `encode(prompt)` y se guarda"""
+        key = (model, prompt)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            PROMPT_CACHE_LOOKUPS.inc(1, "hit")
+            return value
+        self.misses += 1
+        PROMPT_CACHE_LOOKUPS.inc(1, "miss")
+        value = encode(prompt)
+        self.put(key, value)
+        return value
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+# Un solo cache por proceso, compartido por todas las sesiones y backends
+PROMPT_CACHE = PromptEmbeddingCache()
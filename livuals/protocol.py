@@ -0,0 +1,154 @@
+"""Framing binario versionado para /api/ws.
+
+Cada frame de entrada viaja en un solo mensaje binario:
+
+    header (HEADER) | params JSON (params_len bytes, opcional) | imagen JPEG
+
+El cliente solo incluye los params (con FLAG_PARAMS) cuando cambian; el
+resto de los frames referencian la última revisión enviada con `params_rev`.
+El modo se negocia al conectar con `?protocol=binary-v1`; sin ese parámetro
+se usa el flujo legacy de tres mensajes (next_frame, params JSON, bytes).
+
+Con `?output=ws` la salida también viaja por el mismo socket, un mensaje
+binario por frame:
+
+    header (OUTPUT_HEADER) | imagen codificada
+
+con el `seq` del frame de entrada que la produjo y los tiempos del servidor,
+para medir latencia glass-to-glass y descartar frames viejos. Sin ese
+parámetro la salida sigue siendo el MJPEG de /api/stream.
+
+Con `?flow=credit` el servidor otorga varios `send_frame` por adelantado
+(créditos, ver flow.CreditWindow) en lugar de uno por frame (lockstep).
+"""
+
+import json
+import struct
+from typing import Any, Dict, NamedTuple, Optional
+
+PROTOCOL_LEGACY = "legacy"
+PROTOCOL_BINARY_V1 = "binary-v1"
+PROTOCOLS = (PROTOCOL_LEGACY, PROTOCOL_BINARY_V1)
+
+FRAME_MAGIC = b"LV"
+FRAME_VERSION = 1
+
+# magic, version, flags, seq, capture_ts (ms, reloj del cliente), params_rev, params_len
+HEADER = struct.Struct("<2sBBIdII")
+
+FLAG_PARAMS = 0x01
+
+OUTPUT_MJPEG = "mjpeg"
+OUTPUT_WS = "ws"
+OUTPUTS = (OUTPUT_MJPEG, OUTPUT_WS)
+
+FLOW_LOCKSTEP = "lockstep"
+FLOW_CREDIT = "credit"
+FLOWS = (FLOW_LOCKSTEP, FLOW_CREDIT)
+
+OUTPUT_MAGIC = b"LO"
+OUTPUT_VERSION = 1
+
+# magic, version, flags, seq, capture_ts (eco del cliente), received_ts y sent_ts
+# (ms, reloj del servidor), queue_ms, infer_ms, encode_ms
+OUTPUT_HEADER = struct.Struct("<2sBBIdddfff")
+
+
+class ProtocolError(ValueError):
+    """Mensaje binario mal formado o de una versión no soportada."""
+
+    pass
+
+
+class InputFrame(NamedTuple):
+    seq: int
+    capture_ts: float
+    params_rev: int
+    params: Optional[Dict[str, Any]]
+    image: memoryview
+
+
+class OutputTimings(NamedTuple):
+    seq: int
+    capture_ts: float
+    received_ts: float
+    sent_ts: float
+    queue_ms: float
+    infer_ms: float
+    encode_ms: float
+
+
+def negotiate_protocol(requested: Optional[str]) -> str:
+    if requested in PROTOCOLS:
+        return requested
+    return PROTOCOL_LEGACY
+
+
+def negotiate_output(requested: Optional[str]) -> str:
+    if requested in OUTPUTS:
+        return requested
+    return OUTPUT_MJPEG
+
+
+def negotiate_flow(requested: Optional[str]) -> str:
+    if requested in FLOWS:
+        return requested
+    return FLOW_LOCKSTEP
+
+
+def decode_input_frame(data: bytes) -> InputFrame:
+    if len(data) < HEADER.size:
+        raise ProtocolError("Frame too short")
+    magic, version, flags, seq, capture_ts, params_rev, params_len = HEADER.unpack_from(
+        data
+    )
+    if magic != FRAME_MAGIC:
+        raise ProtocolError("Bad frame magic")
+    if version != FRAME_VERSION:
+        raise ProtocolError(f"Unsupported frame version: {version}")
+    view = memoryview(data)
+    offset = HEADER.size
+    params = None
+    if flags & FLAG_PARAMS:
+        if offset + params_len > len(data):
+            raise ProtocolError("Truncated params")
+        try:
+            params = json.loads(bytes(view[offset:offset + params_len]))
+        except ValueError as e:
+            raise ProtocolError(f"Invalid params JSON: {e}") from e
+        if not isinstance(params, dict):
+            raise ProtocolError("Params must be a JSON object")
+        offset += params_len
+    return InputFrame(seq, capture_ts, params_rev, params, view[offset:])
+
+
+def encode_input_frame(
+    seq: int,
+    capture_ts: float,
+    params_rev: int,
+    image: bytes,
+    params: Optional[Dict[str, Any]] = None,
+) -> bytes:
+    """Arma un frame de entrada (lado cliente, útil para clientes Python y pruebas)"""
+    params_data = json.dumps(params).encode() if params is not None else b""
+    flags = FLAG_PARAMS if params is not None else 0
+    header = HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, flags, seq, capture_ts, params_rev, len(params_data)
+    )
+    return b"".join((header, params_data, image))
+
+
+def encode_output_header(timings: OutputTimings) -> bytes:
+    return OUTPUT_HEADER.pack(OUTPUT_MAGIC, OUTPUT_VERSION, 0, *timings)
+
+
+def decode_output_frame(data: bytes):
+    """Separa un frame de salida en (OutputTimings, imagen) (lado cliente)"""
+    if len(data) < OUTPUT_HEADER.size:
+        raise ProtocolError("Frame too short")
+    magic, version, _flags, *timings = OUTPUT_HEADER.unpack_from(data)
+    if magic != OUTPUT_MAGIC:
+        raise ProtocolError("Bad frame magic")
+    if version != OUTPUT_VERSION:
+        raise ProtocolError(f"Unsupported frame version: {version}")
+    return OutputTimings(*timings), memoryview(data)[OUTPUT_HEADER.size:]
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# Estado que StreamDiffusion.prepare() deja armado y que depende solo del
+# schedule (steps + t_index_list). prompt_embeds queda afuera: lo actualiza
+# update_prompt en cada frame.
+SCHEDULE_ATTRS = (
+    "t_list",
+    "denoising_steps_num",
+    "batch_size",
+    "timesteps",
+    "sub_timesteps",
+    "sub_timesteps_tensor",
+    "c_skip",
+    "c_out",
+    "alpha_prod_t_sqrt",
+    "beta_prod_t_sqrt",
+    "init_noise",
+    "stock_noise",
+    "x_t_latent_buffer",
+    "guidance_scale",
+    "delta",
+)
+SCHEDULER_ATTRS = ("timesteps", "num_inference_steps")
+
+
+def schedule_key(total_steps: int, t_index_list: Iterable[int]) -> Tuple[int, Tuple[int, ...]]:
+    return int(total_steps), tuple(t_index_list)
+
+
+class ScheduleCache:
+    """LRU de schedules ya preparados de un StreamDiffusion.
+
+    Cambiar los steps con un slider llamaba a `prepare` en cada valor
+    (scheduler, timesteps, escalas y encoder de texto en el hilo de
+    inferencia). Con el cache, un schedule ya visto se restaura asignando
+    las referencias guardadas: prepare y el paso de denoising reasignan esos
+    tensores en vez de modificarlos in place, así que el snapshot no cambia.
+
+    Los tensores dependen de la resolución y del batch: hay que vaciar el
+    cache (`clear`) cuando se recrea el stream.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @staticmethod
+    def snapshot(stream) -> Dict[str, Any]:
+        state = {name: getattr(stream, name) for name in SCHEDULE_ATTRS if hasattr(stream, name)}
+        scheduler = getattr(stream, "scheduler", None)
+        if scheduler is not None:
+            state["scheduler"] = {
+                name: getattr(scheduler, name) for name in SCHEDULER_ATTRS if hasattr(scheduler, name)
+            }
+        return state
+
+    @staticmethod
+    def restore(stream, state: Dict[str, Any]):
+        for name, value in state.items():
+            if name == "scheduler":
+                for attr, attr_value in value.items():
+                    setattr(stream.scheduler, attr, attr_value)
+            else:
+                setattr(stream, name, value)
+
+    def store(self, key: Hashable, stream):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = self.snapshot(stream)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def apply(self, key: Hashable, stream, prepare: Callable[[], None]) -> bool:
+        """Deja `stream` con el schedule `key`: restaura el snapshot si está
+        en el cache (True) o corre `prepare` y lo guarda (False)"""
+        state: Optional[Dict[str, Any]] = self._entries.get(key)
+        if state is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.restore(stream, state)
+            return True
+        self.misses += 1
+        prepare()
+        self.store(key, stream)
+        return False
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from inference import InferenceExecutor
+
+
+def default_batch_key(params) -> Hashable:
+    return (params.width, params.height)
+
+
+class BatchScheduler:
+    """Agrupa frames de varias sesiones en una sola llamada batch.
+
+    El primer frame que llega abre una ventana de `window` segundos; al
+    cerrarse (o al llegar a `max_batch` frames) los pendientes se agrupan por
+    `pipeline.batch_key` y cada grupo se procesa con `pipeline.predict_batch`
+    en el hilo de inferencia. Cada sesión recibe su propio resultado.
+
+    El pipeline solo necesita `predict_batch(params_list) -> list`, así que
+    puede reemplazarse por un stub en CPU.
+    """
+
+    def __init__(
+        self,
+        executor: InferenceExecutor,
+        pipeline,
+        window: float = 0.0,
+        max_batch: int = 1,
+    ):
+        self.executor = executor
+        self.pipeline = pipeline
+        self.window = max(0.0, window)
+        self.max_batch = max(1, max_batch)
+        self.batch_key: Callable[[Any], Hashable] = getattr(
+            pipeline, "batch_key", default_batch_key
+        )
+        self._pending: List[Tuple[Any, Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.frames = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1 and hasattr(self.pipeline, "predict_batch")
+
+    async def submit(self, user_id, params) -> Any:
+        """Encola el frame de una sesión y espera la imagen resultante"""
+        if "session" in getattr(params, "_fields", ()):
+            # El pipeline necesita saber de qué sesión es cada slot del batch
+            params = params._replace(session=user_id)
+        if not self.enabled:
+            return await self.executor.predict(params)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, params, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush
+            )
+        return await future
+
+    def cancel(self, user_id):
+        """Retira los frames pendientes de una sesión que se desconectó y
+        le avisa al pipeline para que suelte su estado"""
+        forget = getattr(self.pipeline, "forget_session", None)
+        if forget is not None:
+            forget(user_id)
+        remaining = []
+        for item in self._pending:
+            if item[0] == user_id:
+                item[2].cancel()
+            else:
+                remaining.append(item)
+        self._pending = remaining
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        groups: Dict[Hashable, List[Tuple[Any, Any, asyncio.Future]]] = {}
+        for item in pending:
+            if item[2].done():
+                continue
+            groups.setdefault(self.batch_key(item[1]), []).append(item)
+        for items in groups.values():
+            for start in range(0, len(items), self.max_batch):
+                asyncio.ensure_future(self._run(items[start:start + self.max_batch]))
+
+    async def _run(self, items: List[Tuple[Any, Any, asyncio.Future]]):
+        self.batches += 1
+        self.frames += len(items)
+        try:
+            results = await self.executor.run(
+                self.pipeline.predict_batch, [params for _, params, _ in items]
+            )
+        except Exception as e:
+            logging.error(f"Batch Prediction Error: {e}")
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": round(self.window * 1000, 2),
+            "max_batch": self.max_batch,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch": round(self.frames / self.batches, 2) if self.batches else 0,
+        }
@@ -0,0 +1,191 @@
+"""Lector de la salida por memoria compartida (`--shm-output`).
+
+Solo depende de numpy y la librería estándar: se puede copiar tal cual a
+cualquier proceso local (TouchDesigner, un script de OBS, ...).
+
+Layout del segmento POSIX (/dev/shm/<nombre>), todo little-endian:
+
+    header (64 bytes)
+        magic "LVSM", version u16, flags u16 (bit 0: cerrado),
+        slots u32, slot_capacity u32, max_width u32, max_height u32,
+        channels u32 (4, RGBA), reservado u32, frame_counter u64
+    slots[slots], cada uno alineado a 64 bytes
+        seq u64, frame_id u64, width u32, height u32, timestamp f64,
+        pixels RGBA uint8 (height * width * 4, hasta slot_capacity)
+
+`frame_counter` es el id del último frame completo; vive en el slot
+`frame_counter % slots`. El `seq` de cada slot es un seqlock: el escritor
+lo deja impar mientras escribe y par al terminar, así el lector detecta
+lecturas a medio escribir comparando `seq` antes y después de copiar.
+
+Uso:
+
+    reader = ShmReader("livuals")
+    frame_id, rgba = reader.read()   # None si no hay frame nuevo
+"""
+
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"LVSM"
+VERSION = 1
+FLAG_CLOSED = 1
+CHANNELS = 4
+
+HEADER = struct.Struct("<4sHHIIIIIIQ")
+HEADER_SIZE = 64
+FRAME_COUNTER_OFFSET = 32
+SLOT_HEADER = struct.Struct("<QQIId")
+SLOT_HEADER_SIZE = 32
+FLAGS_OFFSET = 6
+
+U64 = struct.Struct("<Q")
+U16 = struct.Struct("<H")
+
+
+def slot_stride(capacity: int) -> int:
+    return (SLOT_HEADER_SIZE + capacity + 63) // 64 * 64
+
+
+def segment_size(slots: int, capacity: int) -> int:
+    return HEADER_SIZE + slots * slot_stride(capacity)
+
+
+def slot_offset(index: int, capacity: int) -> int:
+    return HEADER_SIZE + index * slot_stride(capacity)
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Abre un segmento existente sin adueñarse de él.
+
+    Hasta Python 3.13 `SharedMemory` registra también los segmentos que solo
+    se abren, y el resource_tracker los borraría al salir el lector.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class TornRead(Exception):
+    """El escritor pisó el slot mientras se copiaba"""
+
+
+class ShmReader:
+    def __init__(self, name: str = "livuals", retries: int = 3):
+        self.name = name
+        self.retries = retries
+        self.last_frame_id = -1
+        self.torn = 0
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._out: Optional[np.ndarray] = None
+
+    def _open(self):
+        shm = attach(self.name)
+        magic, version, _, slots, capacity, _, _, channels, _, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION or channels != CHANNELS:
+            shm.close()
+            raise ValueError(f"{self.name}: no es un segmento de livuals v{VERSION}")
+        self._shm = shm
+        self.slots = slots
+        self.capacity = capacity
+
+    def close(self):
+        self._out = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # Quedan vistas de read(copy=False) vivas: el mmap se libera con ellas
+                pass
+            self._shm = None
+
+    @property
+    def closed(self) -> bool:
+        """El escritor cerró el segmento (hay que volver a abrir por nombre)"""
+        return self._shm is None or bool(U16.unpack_from(self._shm.buf, FLAGS_OFFSET)[0] & FLAG_CLOSED)
+
+    def frame_counter(self) -> int:
+        if self._shm is None:
+            self._open()
+        return U64.unpack_from(self._shm.buf, FRAME_COUNTER_OFFSET)[0]
+
+    def read(self, copy: bool = True) -> Optional[Tuple[int, np.ndarray]]:
+        """Último frame completo como (frame_id, array HxWx4 RGBA) o None si
+        no hay uno nuevo.
+
+        Con `copy=True` los píxeles se copian a un buffer propio que se
+        reutiliza entre llamadas (una sola copia, validada con el seqlock).
+        Con `copy=False` se devuelve una vista directa al slot: cero copias,
+        válida hasta que el escritor vuelva a ese slot (`slots` frames).
+        """
+        if self._shm is None or self.closed:
+            self.close()
+            try:
+                self._open()
+            except FileNotFoundError:
+                # El escritor todavía no creó el segmento (o lo está recreando)
+                return None
+        for _ in range(self.retries + 1):
+            frame_id = self.frame_counter()
+            if frame_id == 0 or frame_id == self.last_frame_id:
+                return None
+            try:
+                pixels = self._read_slot(frame_id, copy)
+            except TornRead:
+                self.torn += 1
+                continue
+            self.last_frame_id = frame_id
+            return frame_id, pixels
+        return None
+
+    def _read_slot(self, frame_id: int, copy: bool) -> np.ndarray:
+        buf = self._shm.buf
+        offset = slot_offset(frame_id % self.slots, self.capacity)
+        seq, slot_frame, width, height, _ = SLOT_HEADER.unpack_from(buf, offset)
+        if seq & 1 or slot_frame != frame_id or width * height * CHANNELS > self.capacity:
+            raise TornRead()
+        view = np.ndarray(
+            (height, width, CHANNELS), dtype=np.uint8, buffer=buf,
+            offset=offset + SLOT_HEADER_SIZE,
+        )
+        if copy:
+            if self._out is None or self._out.shape != view.shape:
+                self._out = np.empty_like(view)
+            np.copyto(self._out, view)
+            view = self._out
+        if U64.unpack_from(buf, offset)[0] != seq:
+            raise TornRead()
+        return view
+
+    def frames(self, poll: float = 0.001):
+        """Generador de frames nuevos; espera con sleeps cortos"""
+        while True:
+            frame = self.read()
+            if frame is None:
+                time.sleep(poll)
+                continue
+            yield frame
+
+
+if __name__ == "__main__":
+    import sys
+
+    reader = ShmReader(sys.argv[1] if len(sys.argv) > 1 else "livuals")
+    start = time.perf_counter()
+    count = 0
+    for frame_id, rgba in reader.frames():
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= 1.0:
+            print(f"frame {frame_id} {rgba.shape[1]}x{rgba.shape[0]} "
+                  f"{count / elapsed:.1f} fps, torn {reader.torn}")
+            start = time.perf_counter()
+            count = 0
@@ -0,0 +1,125 @@
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from frame_bus import FrameSink
+from frames import Frame
+from shm_reader import (
+    CHANNELS,
+    FLAG_CLOSED,
+    FLAGS_OFFSET,
+    FRAME_COUNTER_OFFSET,
+    HEADER,
+    MAGIC,
+    SLOT_HEADER,
+    SLOT_HEADER_SIZE,
+    U16,
+    U64,
+    VERSION,
+    segment_size,
+    slot_offset,
+)
+
+
+class ShmSink(FrameSink):
+    """Salida RGBA cruda a un ring buffer en memoria compartida POSIX
+    (/dev/shm/<nombre>) para compositores locales en Linux, sin codificar.
+
+    El layout y el lector están en shm_reader.py. Los slots tienen tamaño
+    fijo (`max_width` x `max_height`); si llega un frame más grande el
+    segmento se marca cerrado y se recrea, y los lectores se reabren solos.
+    """
+
+    name = "shm"
+
+    def __init__(self, segment: str = "livuals", slots: int = 3, max_width: int = 512, max_height: int = 512):
+        self.segment = segment
+        self.slots = max(2, slots)
+        self.max_width = max_width
+        self.max_height = max_height
+        self.frame_id = 0
+        self.recreated = 0
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._pixels: Dict[int, np.ndarray] = {}
+
+    @property
+    def capacity(self) -> int:
+        return self.max_width * self.max_height * CHANNELS
+
+    def open(self):
+        size = segment_size(self.slots, self.capacity)
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.segment, create=True, size=size)
+        except FileExistsError:
+            # Quedó de una corrida anterior que no terminó bien
+            stale = shared_memory.SharedMemory(name=self.segment)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=self.segment, create=True, size=size)
+        HEADER.pack_into(
+            self._shm.buf, 0, MAGIC, VERSION, 0, self.slots, self.capacity,
+            self.max_width, self.max_height, CHANNELS, 0, self.frame_id,
+        )
+        print(f"Salida shm /dev/shm/{self.segment}: {self.slots} slots de {self.max_width}x{self.max_height} RGBA")
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._pixels.clear()
+        try:
+            U16.pack_into(self._shm.buf, FLAGS_OFFSET, FLAG_CLOSED)
+            self._shm.close()
+        finally:
+            self._shm.unlink()
+            self._shm = None
+
+    def _slot_pixels(self, index: int, width: int, height: int) -> np.ndarray:
+        """Vista (H, W, 4) sobre los píxeles del slot, con el alpha ya en 255"""
+        view = self._pixels.get(index)
+        if view is None or view.shape[:2] != (height, width):
+            view = np.ndarray(
+                (height, width, CHANNELS), dtype=np.uint8, buffer=self._shm.buf,
+                offset=slot_offset(index, self.capacity) + SLOT_HEADER_SIZE,
+            )
+            view[..., 3] = 255
+            self._pixels[index] = view
+        return view
+
+    def send(self, frame: Frame, params: Any):
+        width, height = frame.size
+        if width * height * CHANNELS > self.capacity:
+            self.close()
+            self.max_width = max(self.max_width, width)
+            self.max_height = max(self.max_height, height)
+            self.recreated += 1
+            self.open()
+        elif self._shm is None:
+            self.open()
+
+        frame_id = self.frame_id + 1
+        index = frame_id % self.slots
+        buf = self._shm.buf
+        offset = slot_offset(index, self.capacity)
+
+        # Seqlock: impar mientras se escribe el slot, par cuando está completo
+        seq = U64.unpack_from(buf, offset)[0]
+        U64.pack_into(buf, offset, seq + 1)
+        pixels = self._slot_pixels(index, width, height)
+        pixels[..., :3] = frame.to_array()
+        SLOT_HEADER.pack_into(buf, offset, seq + 1, frame_id, width, height, time.time())
+        U64.pack_into(buf, offset, seq + 2)
+
+        # Recién ahora el frame es visible para los lectores
+        U64.pack_into(buf, FRAME_COUNTER_OFFSET, frame_id)
+        self.frame_id = frame_id
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segment": self.segment,
+            "slots": self.slots,
+            "max_size": [self.max_width, self.max_height],
+            "frame_id": self.frame_id,
+            "recreated": self.recreated,
+        }
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+StageFn = Callable[[Any], Awaitable[Optional[Any]]]
+
+_END = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+
+    def as_dict(self, elapsed: float, queue_depth: Optional[int] = None) -> Dict[str, Any]:
+        stats = {
+            "items": self.items,
+            "busy_ms": round(self.busy * 1000, 1),
+            "avg_ms": round(self.busy * 1000 / self.items, 2) if self.items else 0,
+            # Fracción del tiempo ocupada: la etapa cuello de botella se acerca a 1
+            "occupancy": round(self.busy / elapsed, 3) if elapsed > 0 else 0,
+            # Tiempo esperando que la etapa siguiente libere lugar
+            "blocked": round(self.blocked / elapsed, 3) if elapsed > 0 else 0,
+        }
+        if queue_depth is not None:
+            stats["queue_depth"] = queue_depth
+        return stats
+
+
+class StagePipeline:
+    """Corre una secuencia de etapas async (decode → infer → encode → ...) sobre
+    los items de una fuente.
+
+    En modo `pipelined` cada etapa corre en su propia tarea y se comunican con
+    colas acotadas, así el frame N+1 entra a inferencia mientras el N se codifica
+    y se envía. Si no, las etapas se ejecutan una tras otra por item (lockstep).
+    Una etapa que devuelve None descarta el item; una excepción corta el
+    pipeline y se propaga al consumidor.
+
+    El tiempo que el consumidor tarda entre items se mide como la etapa `sink_name`.
+    """
+
+    def __init__(
+        self,
+        stages: List[Tuple[str, StageFn]],
+        pipelined: bool = False,
+        queue_size: int = 1,
+        sink_name: str = "send",
+    ):
+        self.stages = stages
+        self.pipelined = pipelined
+        self.queue_size = max(1, queue_size)
+        self._stats = [StageStats(name) for name, _ in stages]
+        self._sink = StageStats(sink_name)
+        self._queues: List[asyncio.Queue] = []
+        self._started: Optional[float] = None
+
+    async def run(self, source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        self._started = time.perf_counter()
+        items = self._run_pipelined(source) if self.pipelined else self._run_serial(source)
+        try:
+            async for item in items:
+                start = time.perf_counter()
+                yield item
+                self._sink.items += 1
+                self._sink.busy += time.perf_counter() - start
+        finally:
+            await items.aclose()
+
+    async def _run_serial(self, source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        async for item in source:
+            for (_, fn), stats in zip(self.stages, self._stats):
+                start = time.perf_counter()
+                item = await fn(item)
+                stats.busy += time.perf_counter() - start
+                if item is None:
+                    break
+                stats.items += 1
+            else:
+                yield item
+
+    async def _run_pipelined(self, source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        self._queues = [asyncio.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        tasks = [asyncio.ensure_future(self._feed(source, self._queues[0]))]
+        for i, ((_, fn), stats) in enumerate(zip(self.stages, self._stats)):
+            tasks.append(
+                asyncio.ensure_future(
+                    self._worker(fn, stats, self._queues[i], self._queues[i + 1])
+                )
+            )
+        output = self._queues[-1]
+        try:
+            while True:
+                item = await output.get()
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _feed(self, source: AsyncIterator[Any], queue: asyncio.Queue):
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_END)
+
+    async def _worker(self, fn: StageFn, stats: StageStats, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while True:
+            item = await inbox.get()
+            if item is _END or isinstance(item, BaseException):
+                await outbox.put(item)
+                return
+            start = time.perf_counter()
+            try:
+                item = await fn(item)
+            except Exception as e:
+                await outbox.put(e)
+                return
+            stats.busy += time.perf_counter() - start
+            if item is None:
+                continue
+            stats.items += 1
+            start = time.perf_counter()
+            await outbox.put(item)
+            stats.blocked += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        stages = {}
+        for i, stats in enumerate(self._stats):
+            depth = self._queues[i].qsize() if self._queues else None
+            stages[stats.name] = stats.as_dict(elapsed, depth)
+        stages[self._sink.name] = self._sink.as_dict(
+            elapsed, self._queues[-1].qsize() if self._queues else None
+        )
+        return {"pipelined": self.pipelined, "stages": stages}
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Ruteo de frames entre sesiones con el denoising batch (sin GPU).
+
+FakeStream imita a StreamDiffusion con 2 t_index: la salida del slot j se
+termina con lo que dejó en x_t_latent_buffer la entrada del slot j en la
+llamada anterior. Cada sesión tiene que recibir siempre algo hecho con su
+propio frame anterior, aunque cambie la composición del batch.
+
+Uso:
+    python -m pytest test_batch_routing.py
+    python test_batch_routing.py
+"""
+import asyncio
+from types import SimpleNamespace
+
+import torch
+
+from inference import InferenceExecutor
+from latent_slots import SessionLatents
+from params_cache import params_type
+from scheduler import BatchScheduler
+
+
+class FakeStream:
+    def __init__(self, frame_buffer_size: int):
+        self.frame_bff_size = frame_buffer_size
+        self.x_t_latent_buffer = torch.zeros(frame_buffer_size, 1, 1, 1)
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        output = self.x_t_latent_buffer.clone()
+        self.x_t_latent_buffer = inputs.clone()
+        return output
+
+
+class FakePipeline:
+    """predict_batch como Pipeline._infer_batch: chunks de frame_buffer_size
+    slots, relleno repitiendo el último y route antes de cada llamada"""
+
+    def __init__(self, frame_buffer_size: int):
+        self.stream = FakeStream(frame_buffer_size)
+        self.session_latents = SessionLatents()
+
+    def batch_key(self, params):
+        return params.width
+
+    def forget_session(self, session):
+        self.session_latents.forget(session)
+
+    def predict_batch(self, params_list):
+        size = self.stream.frame_bff_size
+        outputs = []
+        for start in range(0, len(params_list), size):
+            chunk = params_list[start:start + size]
+            values = [p.image for p in chunk]
+            values += [values[-1]] * (size - len(values))
+            owners = [p.session for p in chunk] + [None] * (size - len(chunk))
+            self.session_latents.route(self.stream, owners)
+            output = self.stream(torch.tensor(values, dtype=torch.float32).view(size, 1, 1, 1))
+            outputs.extend(float(v) for v in output[:len(chunk)].flatten())
+        return outputs
+
+
+def _run_batches(latents, stream, batches):
+    """Cada batch es [(sesión, valor)]; devuelve [{sesión: salida}] por llamada"""
+    results = []
+    for batch in batches:
+        owners = [session for session, _ in batch]
+        owners += [None] * (stream.frame_bff_size - len(owners))
+        values = [value for _, value in batch]
+        values += [values[-1]] * (stream.frame_bff_size - len(values))
+        latents.route(stream, owners)
+        output = stream(torch.tensor(values, dtype=torch.float32).view(-1, 1, 1, 1))
+        results.append({session: float(output[i]) for i, (session, _) in enumerate(batch)})
+    return results
+
+
+def test_route_keeps_each_session_latents():
+    stream, latents = FakeStream(2), SessionLatents()
+    results = _run_batches(latents, stream, [
+        [("a", 1), ("b", 10)],
+        [("b", 11), ("a", 2)],  # mismas sesiones, slots cambiados
+        [("a", 3), ("c", 100)],  # b sale, entra c
+        [("c", 101)],  # c sola, con relleno
+        [("b", 12), ("a", 4)],  # vuelve b
+        [("b", 13), ("a", 5)],  # misma composición: sin swap
+    ])
+    assert results == [
+        {"a": 0.0, "b": 0.0},
+        {"b": 10.0, "a": 1.0},
+        {"a": 2.0, "c": 0.0},
+        {"c": 100.0},
+        {"b": 11.0, "a": 3.0},
+        {"b": 12.0, "a": 4.0},
+    ]
+    assert latents.swaps == 5
+
+
+def test_route_without_buffer_is_noop():
+    stream = SimpleNamespace(frame_bff_size=1, x_t_latent_buffer=None)
+    latents = SessionLatents()
+    latents.route(stream, ["a"])
+    latents.route(stream, ["b"])
+    assert stream.x_t_latent_buffer is None and latents.swaps == 0
+
+
+def test_forget_and_reset():
+    stream, latents = FakeStream(1), SessionLatents()
+    _run_batches(latents, stream, [[("a", 1)], [("b", 2)]])
+    assert len(latents) == 1
+    latents.forget("a")
+    assert _run_batches(latents, stream, [[("a", 3)]]) == [{"a": 0.0}]
+    # Olvidada mientras ocupa el slot: no se guarda al salir
+    latents.forget("a")
+    _run_batches(latents, stream, [[("b", 4)]])
+    assert len(latents) == 1
+    assert _run_batches(latents, stream, [[("a", 5)]]) == [{"a": 0.0}]
+    latents.reset()
+    assert len(latents) == 0 and latents.owners is None
+
+
+def test_release_moves_sessions_between_streams():
+    """Del stream de 2 frames al de 1 (sesión sola) y de vuelta"""
+    batch, solo, latents = FakeStream(2), FakeStream(1), SessionLatents()
+    assert _run_batches(latents, batch, [[("a", 1), ("b", 10)]]) == [{"a": 0.0, "b": 0.0}]
+    latents.release(batch)
+    assert _run_batches(latents, solo, [[("a", 2)], [("a", 3)]]) == [{"a": 1.0}, {"a": 2.0}]
+    latents.release(solo)
+    assert _run_batches(latents, batch, [[("b", 11), ("a", 4)]]) == [{"b": 10.0, "a": 3.0}]
+
+
+def test_scheduler_routes_outputs_when_composition_changes():
+    """Sesiones con distinta batch_key y llegadas intercaladas: cada una
+    recibe la salida de su frame anterior, nunca la de otra"""
+    pipeline = FakePipeline(2)
+    Params = params_type(type("InputParams", (), {"__fields__": ("width",)}))
+
+    async def scenario():
+        executor = InferenceExecutor(pipeline)
+        scheduler = BatchScheduler(executor, pipeline, window=0.005, max_batch=2)
+        sent = {"a": [], "b": [], "c": []}
+
+        async def send(session, width, value):
+            sent[session].append(value)
+            params = Params(width=width, enableSpout=False, revision=1, image=value)
+            return session, value, await scheduler.submit(session, params)
+
+        rounds = [
+            [("a", 512, 1), ("b", 512, 10)],
+            [("b", 512, 11), ("a", 512, 2), ("c", 384, 100)],
+            [("c", 512, 101), ("a", 512, 3)],
+            [("a", 384, 4), ("b", 512, 12), ("c", 512, 102)],
+            [("b", 512, 13)],
+        ]
+        received = []
+        for frames in rounds:
+            received += await asyncio.gather(*(send(*frame) for frame in frames))
+        executor.shutdown()
+        return sent, received
+
+    sent, received = asyncio.run(scenario())
+    for session, value, output in received:
+        history = sent[session]
+        previous = history[history.index(value) - 1] if history.index(value) else 0.0
+        assert output == previous, (session, value, output)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: ok")
@@ -0,0 +1,105 @@
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, NamedTuple, Optional
+
+from metrics import REGISTRY
+
+GLASS_TO_GLASS_SECONDS = REGISTRY.histogram(
+    "livuals_glass_to_glass_seconds",
+    "Client capture to client display latency reported by clients",
+    buckets=(0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+)
+
+
+class LatencySummary:
+    """Percentiles sobre una ventana deslizante de las últimas `window` muestras"""
+
+    def __init__(self, window: int = 512):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value: float):
+        self._samples.append(value)
+        self.count += 1
+
+    def summary(self) -> Optional[Dict[str, float]]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        last = len(ordered) - 1
+
+        def pct(q: float) -> float:
+            return round(ordered[min(last, int(round(q * last)))], 2)
+
+        return {
+            "count": self.count,
+            "window": len(ordered),
+            "p50": pct(0.5),
+            "p90": pct(0.9),
+            "p99": pct(0.99),
+            "max": round(ordered[-1], 2),
+            "mean": round(sum(ordered) / len(ordered), 2),
+        }
+
+
+class FrameTrace(NamedTuple):
+    seq: int
+    capture_ts: Optional[float]  # ms, reloj del cliente
+    received_ts: float  # ms, reloj del servidor
+    sent_ts: float  # ms, reloj del servidor
+    queue_ms: float
+    infer_ms: float
+    encode_ms: float
+
+
+class FrameTracer:
+    """Trazas de latencia de una sesión, indexadas por el `seq` de cada frame.
+
+    Del lado del servidor registra, por frame enviado, la espera desde que
+    llegó hasta que entra a inferencia (buzón + decode) y el tiempo total
+    recibido → enviado. Cuando el cliente devuelve
+    `{"status": "displayed", "seq", "display_ts"}` se completa la latencia
+    glass-to-glass (captura → display), medida con el reloj del cliente en
+    ambas puntas para no depender de la sincronización de relojes.
+    """
+
+    def __init__(self, max_inflight: int = 128, window: int = 512):
+        self.max_inflight = max_inflight
+        self._inflight: "OrderedDict[int, FrameTrace]" = OrderedDict()
+        self.glass_to_glass = LatencySummary(window)
+        self.server_queue = LatencySummary(window)
+        self.server_total = LatencySummary(window)
+        self.client_delivery = LatencySummary(window)
+        self.unmatched = 0
+
+    def sent(self, trace: FrameTrace):
+        self.server_queue.add(trace.queue_ms)
+        self.server_total.add(trace.sent_ts - trace.received_ts)
+        self._inflight[trace.seq] = trace
+        while len(self._inflight) > self.max_inflight:
+            self._inflight.popitem(last=False)
+
+    def displayed(self, seq: int, display_ts: float) -> Optional[float]:
+        """Cierra la traza de `seq`; devuelve la latencia glass-to-glass en ms"""
+        trace = self._inflight.pop(seq, None)
+        if trace is None or not trace.capture_ts:
+            self.unmatched += 1
+            return None
+        latency = display_ts - trace.capture_ts
+        if latency < 0:
+            self.unmatched += 1
+            return None
+        self.glass_to_glass.add(latency)
+        # Lo que queda fuera del servidor: subida, bajada, decode y render en el cliente
+        self.client_delivery.add(max(0.0, latency - (trace.sent_ts - trace.received_ts)))
+        GLASS_TO_GLASS_SECONDS.observe(latency / 1000)
+        return latency
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "glass_to_glass_ms": self.glass_to_glass.summary(),
+            "server_queue_ms": self.server_queue.summary(),
+            "server_total_ms": self.server_total.summary(),
+            "client_delivery_ms": self.client_delivery.summary(),
+            "inflight": len(self._inflight),
+            "unmatched": self.unmatched,
+        }
@@ -3,8 +3,20 @@ from types import ModuleType
 from typing import Dict, Any
 from pydantic import BaseModel as PydanticBaseModel, Field
 from PIL import Image
+import numpy as np
 import io
 
+try:
+    # libjpeg-turbo con escalado DCT nativo, si está instalado (pip install PyTurboJPEG)
+    from turbojpeg import TurboJPEG, TJPF_RGB
+
+    _turbojpeg = TurboJPEG()
+except Exception:
+    _turbojpeg = None
+
+# Límite por defecto de píxeles de un frame subido (~8 MP, un frame 4K)
+DEFAULT_MAX_INPUT_PIXELS = 3840 * 2160
+
 
 def get_pipeline_class(pipeline_name: str) -> ModuleType:
     try:
@@ -25,6 +37,59 @@ def bytes_to_pil(image_bytes: bytes) -> Image.Image:
     return image
 
 
+def _turbo_scaling_factor(size, target):
+    """Mayor reducción DCT (1/2, 1/4, 1/8...) que no quede por debajo del tamaño destino"""
+    best = (1, 1)
+    for num, denom in _turbojpeg.scaling_factors:
+        if num >= denom:
+            continue
+        w = -(-size[0] * num // denom)
+        h = -(-size[1] * num // denom)
+        if w >= target[0] and h >= target[1] and num / denom < best[0] / best[1]:
+            best = (num, denom)
+    return best
+
+
+def decode_frame(
+    image_bytes: bytes,
+    width: int,
+    height: int,
+    max_pixels: int = DEFAULT_MAX_INPUT_PIXELS,
+) -> np.ndarray:
+    """Decodifica un frame subido directo a la resolución de inferencia.
+
+    Para JPEG usa el escalado en dominio DCT (libjpeg-turbo si está disponible,
+    si no `Image.draft` de PIL), así nunca se decodifica la imagen completa.
+    Devuelve un array uint8 RGB contiguo de (height, width, 3).
+    Lanza ValueError si la imagen supera `max_pixels`.
+    """
+    target = (width, height)
+    if _turbojpeg is not None and image_bytes[:2] == b"\xff\xd8":
+        src_w, src_h, _, _ = _turbojpeg.decode_header(image_bytes)
+        if max_pixels > 0 and src_w * src_h > max_pixels:
+            raise ValueError(f"Input frame too large: {src_w}x{src_h}")
+        array = _turbojpeg.decode(
+            image_bytes,
+            pixel_format=TJPF_RGB,
+            scaling_factor=_turbo_scaling_factor((src_w, src_h), target),
+        )
+        if array.shape[1] == width and array.shape[0] == height:
+            return np.ascontiguousarray(array)
+        image = Image.fromarray(array)
+    else:
+        image = Image.open(io.BytesIO(image_bytes))
+        # Image.open solo lee la cabecera: validar antes de decodificar
+        if max_pixels > 0 and image.width * image.height > max_pixels:
+            raise ValueError(f"Input frame too large: {image.width}x{image.height}")
+        if image.format == "JPEG":
+            image.draft("RGB", target)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    if image.size != target:
+        image = image.resize(target, Image.BICUBIC)
+    return np.asarray(image)
+
+
 def pil_to_frame(image: Image.Image) -> bytes:
     frame_data = io.BytesIO()
     image.save(frame_data, format="JPEG")